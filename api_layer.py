@@ -12,12 +12,14 @@ DB_PATH = "leech_empire_million.db"
 if not os.path.exists(DB_PATH):
     DB_PATH = "leech_empire_100k.db" # Fallback to existing 100k DB
 
-db = LeechDB(DB_PATH)
+# Cache repeated lookups; the TTL bounds staleness against writes from other processes
+db = LeechDB(DB_PATH, cache_size=4096, cache_ttl=60)
 router = SemanticRouter(DB_PATH)
 
 @app.route('/health', methods=['GET'])
 def health():
-    return jsonify({"status": "active", "db": DB_PATH, "lattice": "Leech (24D)"})
+    return jsonify({"status": "active", "db": DB_PATH, "lattice": "Leech (24D)",
+                    "cache": db.cache.stats(), "router_cache": router.cache.stats()})
 
 @app.route('/index', methods=['POST'])
 def index_vector():
@@ -29,29 +31,37 @@ def index_vector():
     label = data.get('label')
     vector = np.array(data.get('vector'))
     
+    if label is None:
+        return jsonify({"error": "Missing label"}), 400
     if vector.shape[0] != 24:
         return jsonify({"error": "Vector must be 24-dimensional"}), 400
         
     db.index_batch([label], vector.reshape(1, -1))
-    return jsonify({"status": "indexed", "label": label})
+    return jsonify({"status": "indexed", "label": str(label)})
 
 @app.route('/search', methods=['POST'])
 def search():
     """
     Performs exact and neighborhood search.
-    Input format: {"vector": [...], "fuzzy": true}
+    Input format: {"vector": [...], "fuzzy": true} or {"vector": [...], "probes": 4}
+    Add "top_k": 10 to re-rank the candidates by distance and return only the nearest ones.
     """
     data = request.json
     vector = np.array(data.get('vector'))
     fuzzy = data.get('fuzzy', False)
+    probes = data.get('probes')
+    top_k = data.get('top_k')
+    top_k = int(top_k) if top_k else None
     
     if vector.shape[0] != 24:
         return jsonify({"error": "Vector must be 24-dimensional"}), 400
     
-    if fuzzy:
-        results = db.query_neighborhood(vector)
+    if probes:
+        results = db.query_multiprobe(vector, probes=int(probes), top_k=top_k)
+    elif fuzzy:
+        results = db.query_neighborhood(vector, top_k=top_k)
     else:
-        results = db.query_exact(vector)
+        results = db.query_exact(vector, top_k=top_k)
         
     return jsonify({"query_vector": vector.tolist()[:3], "results": results})
 
@@ -68,4 +78,5 @@ def route_query():
 
 if __name__ == "__main__":
     print(f"Empire API Layer starting on port 5000... Connected to {DB_PATH}")
-    app.run(host='0.0.0.0', port=5000)
+    # LeechDB gives each request thread its own read connection; writes are serialized
+    app.run(host='0.0.0.0', port=5000, threaded=True)
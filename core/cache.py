@@ -0,0 +1,86 @@
+"""
+Bounded LRU result cache with optional TTL and hit/miss counters.
+
+Query traffic is skewed: many requests snap to the same lattice point, so
+LeechDB and SemanticRouter cache results keyed by the packed centroid key and
+skip the SQL and decoding work on repeats. Writers invalidate the affected
+keys explicitly; the TTL only bounds staleness against writes made through
+other connections or processes.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache:
+    """ Thread-safe LRU mapping; maxsize=0 disables caching. """
+
+    def __init__(self, maxsize=1024, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()  # key -> (value, expires_at)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            return entry is not None and not self._expired(entry)
+
+    def _expired(self, entry):
+        return entry[1] is not None and entry[1] < time.monotonic()
+
+    def get(self, key, default=None):
+        """ Returns the cached value (marking it most recently used) or `default`. """
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or self._expired(entry):
+                if entry is not None:
+                    del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value):
+        if self.maxsize <= 0:
+            return
+        expires_at = time.monotonic() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, keys):
+        """ Drops the given keys; returns how many were cached. """
+        with self._lock:
+            return sum(self._data.pop(key, None) is not None for key in keys)
+
+    def keys(self):
+        """ Snapshot of the cached keys, least recently used first. """
+        with self._lock:
+            return list(self._data)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        """ Hit/miss counters and current size. """
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "evictions": self.evictions,
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+        }
@@ -0,0 +1,127 @@
+"""
+Lattice point codec: compact binary keys for Leech (or any integer lattice) points.
+
+A point is stored as 24 little-endian int16 coordinates, i.e. a fixed-width
+48-byte key. Keys compare with a plain memcmp (cheap SQLite BLOB primary keys)
+and are valid dict keys, and packing/unpacking is vectorized over whole batches
+instead of a per-row map(str, ...) / split(",") round trip.
+
+fingerprint64 gives an additive 64-bit hash of a point for hash tables and
+in-memory sets where the full key is not needed. Being linear, its low bits are
+not uniform over lattice points (Leech fingerprints are always 0 mod 4), so
+anything that buckets by fingerprint % n goes through mix64 first.
+
+encode_residuals / decode_residuals store the quantization residual x - q of
+each vector as a compact float16 (48-byte) or per-row scaled int8 (24-byte)
+code, so candidates can be re-ranked by (approximate) true distance.
+"""
+import numpy as np
+
+DIM = 24
+KEY_DTYPE = np.dtype('<i2')
+KEY_BYTES = DIM * KEY_DTYPE.itemsize
+RESIDUAL_FORMATS = ("float16", "int8")
+
+# Fixed odd 64-bit multipliers for fingerprint64. Fingerprints are persisted
+# (snapshots) and route buckets to shards, so these are literal constants rather
+# than RNG output that could change with the NumPy version. Never change them.
+_FP_MULTIPLIERS = np.array([
+    0xF054522EC1DDE89F, 0x82F6226ED512D0EB, 0xDBBB6B1AC3E624CD,
+    0x484FF6158A9E556B, 0x6B65853527B792C9, 0x5923F4AA9A0E07D5,
+    0xB535FA8C983AB085, 0xC06B2D9DFA78EAA3, 0x66266082470F0225,
+    0x2F09F24755BF43BB, 0xA30B601CCB23AFC5, 0x909C96BFCEF3F0BB,
+    0xBEE5537B4AD00EB1, 0xC21DD84CFE490617, 0xCC65AA45220EFE51,
+    0x2CC5D8AD037B01E5, 0xEF8B4D84FFA8B285, 0x828D6CD2AC6121D7,
+    0x010C2AFD2319778F, 0xB06F6F98F2DAE24D, 0x0DC79C59543B6CC1,
+    0x079C1ABD768D8561, 0x8460877ABBD953B9, 0xE015FEEB3DFD9E23,
+], dtype=np.uint64)
+
+
+def to_coords(points):
+    """ Rounds lattice points to an (N, 24) int16 coordinate array. """
+    points = np.asarray(points)
+    if points.ndim == 1:
+        points = points.reshape(1, -1)
+    if points.dtype.kind in "iu":
+        coords = points
+    else:
+        coords = np.rint(points)
+    if coords.size and (coords.max() > np.iinfo(KEY_DTYPE).max or coords.min() < np.iinfo(KEY_DTYPE).min):
+        raise ValueError("Lattice coordinates exceed the int16 key range")
+    return np.ascontiguousarray(coords, dtype=KEY_DTYPE)
+
+def pack_array(points):
+    """ Packs N points into an (N,) array of fixed-width 48-byte void scalars. """
+    return to_coords(points).view(np.dtype((np.void, KEY_BYTES))).ravel()
+
+def pack_keys(points):
+    """ Packs N points into a list of 48-byte `bytes` keys. """
+    buf = to_coords(points).tobytes()
+    return [buf[i:i + KEY_BYTES] for i in range(0, len(buf), KEY_BYTES)]
+
+def pack_key(point):
+    """ Packs a single point into a 48-byte `bytes` key. """
+    return to_coords(point).tobytes()
+
+def unpack_keys(keys):
+    """ Unpacks a key, a list of keys or a packed void array into an (N, 24) int16 array. """
+    if isinstance(keys, (bytes, bytearray, memoryview)):
+        buf = bytes(keys)
+    elif isinstance(keys, np.ndarray):
+        buf = np.ascontiguousarray(keys).tobytes()
+    else:
+        buf = b"".join(keys)
+    return np.frombuffer(buf, dtype=KEY_DTYPE).reshape(-1, DIM)
+
+def fingerprint64(points):
+    """
+    Vectorized 64-bit fingerprint of each point: sum_i x_i * K_i (mod 2^64) with
+    fixed odd multipliers K_i. Returned as int64 so it fits an SQLite
+    INTEGER column directly.
+
+    The fingerprint is additive, fingerprint(a + b) = fingerprint(a) + fingerprint(b)
+    (mod 2^64), so the fingerprints of q + v for a fixed table of offsets v are a
+    single vector add once the offsets' fingerprints are known.
+    """
+    coords = to_coords(points).astype(np.int64).view(np.uint64)
+    with np.errstate(over='ignore'):
+        h = coords @ _FP_MULTIPLIERS
+    return h.view(np.int64)
+
+def mix64(fingerprints):
+    """
+    splitmix64 finalizer over int64 fingerprints: a fixed bijection whose every
+    output bit depends on every input bit. Use it before taking fingerprints
+    modulo a (power-of-two) table or shard count. Returned as uint64.
+    """
+    z = np.asarray(fingerprints, dtype=np.int64).view(np.uint64)
+    with np.errstate(over='ignore'):
+        z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return z ^ (z >> np.uint64(31))
+
+def encode_residuals(residuals, fmt="float16"):
+    """
+    Encodes (N, 24) residuals as a list of `bytes` codes plus an (N,) float64
+    array of scales. float16 codes ignore the scale (always 1.0); int8 codes
+    are scaled per row so the largest component maps to +-127.
+    """
+    residuals = np.asarray(residuals, dtype=np.float64).reshape(-1, DIM)
+    if fmt == "float16":
+        codes = residuals.astype('<f2')
+        scales = np.ones(len(residuals))
+    elif fmt == "int8":
+        scales = np.abs(residuals).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        codes = np.rint(residuals / scales[:, None]).astype(np.int8)
+    else:
+        raise ValueError(f"Unknown residual format '{fmt}'. Use one of {RESIDUAL_FORMATS}.")
+    buf = codes.tobytes()
+    width = DIM * codes.itemsize
+    return [buf[i:i + width] for i in range(0, len(buf), width)], scales
+
+def decode_residuals(codes, scales, fmt="float16"):
+    """ Decodes codes from encode_residuals back into an (N, 24) float64 array. """
+    dtype = np.dtype('<f2') if fmt == "float16" else np.dtype(np.int8)
+    residuals = np.frombuffer(b"".join(codes), dtype=dtype).reshape(-1, DIM).astype(np.float64)
+    return residuals * np.asarray(scales, dtype=np.float64)[:, None]
@@ -1,5 +1,6 @@
 import numpy as np
 from core.lattices import LeechLattice
+from core import tables
 
 # This is a pre-flight check for CUDA/PyTorch availability
 try:
@@ -18,7 +19,7 @@ class LeechGPU:
     """
     def __init__(self):
         self.leech = LeechLattice()
-        self.c2_cache = (2 * self.leech.golay.get_all_codewords()).astype(np.float32)
+        self.c2_cache = np.ascontiguousarray(tables.golay_c2())
         
         if HAS_TORCH:
             self.device = torch.device("cuda" if HAS_CUDA else "cpu")
@@ -0,0 +1,74 @@
+"""
+In-memory set of occupied lattice points, stored as sorted 64-bit fingerprints.
+
+Membership tests for a whole batch of candidate points are one vectorized
+searchsorted, so probing the ~196k neighbors of a point costs the same whether
+the index holds a thousand buckets or ten million. At 8 bytes per occupied
+point the set stays small enough to keep next to an on-disk index.
+
+New fingerprints go into a small sorted delta that is merged into the main
+array once it grows past a fraction of it, so incremental inserts are
+amortized O(batch log N) instead of rebuilding the whole array each time.
+Both arrays are swapped in as one tuple, so readers in other threads always
+see a consistent snapshot while a single writer adds to the set.
+"""
+import numpy as np
+from core import codec
+
+
+class FingerprintSet:
+    """
+    Set of int64 point fingerprints (see codec.fingerprint64).
+
+    A hit means the point is occupied with overwhelming probability; callers
+    that need certainty confirm hits against the full keys.
+    """
+    # Merge the delta into the main array once it exceeds this fraction of it
+    _MERGE_FRACTION = 8
+
+    def __init__(self, fingerprints=None):
+        main = np.empty(0, dtype=np.int64)
+        if fingerprints is not None:
+            main = np.unique(np.asarray(fingerprints, dtype=np.int64))
+        # (main, delta), replaced as a whole
+        self._arrays = (main, np.empty(0, dtype=np.int64))
+
+    @classmethod
+    def from_points(cls, points):
+        """ Builds the set from an (N, 24) array of lattice points. """
+        return cls(codec.fingerprint64(points) if len(points) else None)
+
+    def __len__(self):
+        main, delta = self._arrays
+        return len(main) + len(delta)
+
+    def add(self, fingerprints):
+        """ Inserts a batch of fingerprints. """
+        new = np.asarray(fingerprints, dtype=np.int64).ravel()
+        if not len(new):
+            return
+        main, delta = self._arrays
+        new = new[~self.contains(new)]
+        delta = np.union1d(delta, new)
+        if len(delta) * self._MERGE_FRACTION > max(len(main), 4096):
+            main, delta = np.union1d(main, delta), np.empty(0, dtype=np.int64)
+        self._arrays = (main, delta)
+
+    def add_points(self, points):
+        """ Inserts the fingerprints of an (N, 24) array of lattice points. """
+        if len(points):
+            self.add(codec.fingerprint64(points))
+
+    def contains(self, fingerprints):
+        """ Returns a boolean mask of which fingerprints are in the set. """
+        fingerprints = np.asarray(fingerprints, dtype=np.int64)
+        main, delta = self._arrays
+        return self._member(main, fingerprints) | self._member(delta, fingerprints)
+
+    @staticmethod
+    def _member(sorted_fps, fingerprints):
+        if not len(sorted_fps):
+            return np.zeros(fingerprints.shape, dtype=bool)
+        idx = np.searchsorted(sorted_fps, fingerprints)
+        np.minimum(idx, len(sorted_fps) - 1, out=idx)
+        return sorted_fps[idx] == fingerprints
@@ -1,4 +1,20 @@
+import heapq
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
+from core import tables
+
+_THREAD_POOLS = {}
+_THREAD_POOLS_LOCK = threading.Lock()
+
+def _thread_pool(n_threads):
+    """ Returns the persistent process-wide pool with `n_threads` workers. """
+    with _THREAD_POOLS_LOCK:
+        pool = _THREAD_POOLS.get(n_threads)
+        if pool is None:
+            pool = ThreadPoolExecutor(max_workers=n_threads, thread_name_prefix="leech-quantize")
+            _THREAD_POOLS[n_threads] = pool
+        return pool
 
 class Lattice:
     """ Base class for lattices. """
@@ -94,11 +110,54 @@ class E8Lattice(Lattice):
         
         return f_x if dist_f < dist_g else g_x
 
+    def quantify_batch(self, X, out=None):
+        """
+        Vectorized E8 decoder for an (N, 8) batch.
+        Runs the same Conway-Sloane steps as quantify() on every row at once:
+        parity fix-up via a row-wise argmax, integer and half-integer candidates
+        for the whole batch, and a row-wise distance comparison.
+        Results are written into `out` if a preallocated (N, 8) buffer is given.
+        """
+        X = np.asarray(X)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        if out is None:
+            out = np.empty(X.shape, dtype=np.result_type(X.dtype, np.float32))
+        rows = np.arange(X.shape[0])
+
+        def round_even(Y):
+            # Nearest point of D8: round, then move the worst coordinate if the sum is odd
+            f = np.round(Y)
+            err = Y - f
+            k = np.argmax(np.abs(err), axis=1)
+            odd = np.mod(f.sum(axis=1), 2) != 0
+            f[rows[odd], k[odd]] += np.where(err[rows[odd], k[odd]] > 0, 1, -1)
+            return f
+
+        # 1. Integer candidates f(x)
+        f_x = round_even(X)
+        # 2. Half-integer candidates g(x) = f(x - 1/2) + 1/2
+        g_x = round_even(X - 0.5)
+        g_x += 0.5
+
+        # 3. Row-wise distance comparison
+        dist_f = np.einsum('ij,ij->i', X - f_x, X - f_x)
+        dist_g = np.einsum('ij,ij->i', X - g_x, X - g_x)
+
+        out[...] = g_x
+        np.copyto(out, f_x, where=(dist_f < dist_g)[:, None])
+        return out
+
     def get_shortest_vectors(self):
         """ 
         Returns the 240 roots (shortest non-zero vectors) of E8.
         These have a norm squared of 2 (length sqrt(2)).
+        Served from the shared process-wide table cache (read-only).
         """
+        return tables.e8_roots()
+
+    def _enumerate_roots(self):
+        """ Builds the 240 E8 roots from scratch (used to populate the table cache). """
         roots = []
         # Type 1: (+-1, +-1, 0, 0, 0, 0, 0, 0) - permutations (112 vectors)
         for i in range(8):
@@ -179,72 +238,139 @@ class GolayCode:
         return np.dot(data_bits, self.generator_matrix) % 2
 
     def get_all_codewords(self):
-        """ Generates all 4096 codewords of the [24, 12, 8] code. """
-        codewords = []
-        for i in range(4096):
-            bits = np.array([(i >> j) & 1 for j in range(12)])
-            codewords.append(self.encode(bits))
-        return np.array(codewords)
+        """
+        Returns all 4096 codewords of the [24, 12, 8] code.
+        Served from the shared process-wide table cache (read-only int8).
+        """
+        return tables.golay_codewords()
+
+    def _enumerate_codewords(self):
+        """ Encodes every 12-bit message at once; row i holds the codeword of message i. """
+        i = np.arange(4096)
+        bits = (i[:, None] >> np.arange(12)) & 1
+        return np.dot(bits, self.generator_matrix) % 2
 
 class LeechLattice(Lattice):
     """
     Implementation of the Leech Lattice in 24-dimensional space.
     Uses the Binary Golay Code construction (Construction B).
+
+    Decoder modes (selected with ``decoder=``):
+      - "coset":      Legacy 4096-coset snap onto 2c + 4Z^24 (default, keeps
+                      existing index keys stable).
+      - "golay":      Fast maximum-likelihood Leech decoder based on soft-decision
+                      Golay decoding. Covers both the even half 2c + 4D24 and the
+                      odd half 1 + 2c + 4(D24 + e1), i.e. the (3, 1^23)-type points.
+      - "exhaustive": Reference ML decoder that runs a D24 decode in every one of
+                      the 8192 cosets. Slow; used to validate "golay".
     """
-    def __init__(self):
+    DECODERS = ("coset", "golay", "exhaustive")
+
+    # Rows per block for the ML decoders; bounds the (rows, 2, 4096) score tensor.
+    _ML_BLOCK = 256
+    _DEFAULT_CHUNK_ROWS = {"coset": 200, "golay": _ML_BLOCK, "exhaustive": 32}
+    # Approximate scratch bytes per input row, used to size chunks under a memory budget
+    _BYTES_PER_ROW = {
+        "coset": 2 * 4096 * 24 * 4 + 4096 * 4,    # candidates + differences + distances
+        "golay": 2 * 4096 * 8 + 2 * 4096 + 2048,  # coset metrics + repair flags + rounding state
+        "exhaustive": 10 * 4096 * 24 * 8,         # per-half D24 temporaries and candidates
+    }
+    # Coordinate offsets h + 2b for (half h, codeword bit b)
+    _ML_OFFSETS = np.array([[0.0, 2.0], [1.0, 3.0]])[None, :, :, None]
+    _ML_HALF_PARITY = np.array([0, 1])
+
+    def __init__(self, decoder="coset"):
         super().__init__(24)
+        if decoder not in self.DECODERS:
+            raise ValueError(f"Unknown decoder '{decoder}'. Use one of {self.DECODERS}.")
+        self.decoder = decoder
         self.golay = GolayCode()
 
-    def get_minimal_vectors(self):
+    def get_minimal_vectors(self, one_per_pair=False):
         """ 
-        Generates the 196,560 minimal vectors of norm 4.
+        Returns the 196,560 minimal vectors of norm 4 as a compact read-only
+        (196560, 24) int8 array served from the shared table cache (~4.7 MB).
+        With one_per_pair=True only one representative of each +-v pair is
+        returned (the one whose first non-zero coordinate is positive), 98,280 rows.
+        """
+        min_vecs = tables.leech_minimal_vectors()
+        if one_per_pair:
+            first_nonzero = min_vecs[np.arange(len(min_vecs)), np.argmax(min_vecs != 0, axis=1)]
+            return min_vecs[first_nonzero > 0]
+        return min_vecs
+
+    def _enumerate_minimal_vectors(self):
+        """
+        Builds the minimal vectors shape by shape with broadcasting over
+        precomputed sign and octad tables (used to populate the table cache).
         """
-        minimal_vectors = []
-        
-        # Shape 1: (4, 4, 0^22) -> 1,104 vectors
-        for i in range(24):
-            for j in range(i + 1, 24):
-                for s1 in [4, -4]:
-                    for s2 in [4, -4]:
-                        v = np.zeros(24)
-                        v[i], v[j] = s1, s2
-                        minimal_vectors.append(v)
-        
-        # Get codewords for Shape 2 and 3
         codewords = self.golay.get_all_codewords()
-        
+
+        # Shape 1: (4, 4, 0^22) -> 1,104 vectors
+        i, j = np.triu_indices(24, k=1)
+        signs = np.array([[4, 4], [4, -4], [-4, 4], [-4, -4]], dtype=np.int8)
+        shape1 = np.zeros((len(i), 4, 24), dtype=np.int8)
+        pair = np.arange(len(i))[:, None]
+        shape1[pair, np.arange(4)[None, :], i[:, None]] = signs[:, 0]
+        shape1[pair, np.arange(4)[None, :], j[:, None]] = signs[:, 1]
+
         # Shape 2: (2^8, 0^16) -> 97,152 vectors
-        # These are based on octads (weight 8 codewords)
+        # Octads (weight 8 codewords) carry the 2^7 sign patterns with an even number of minus signs
         octads = codewords[np.sum(codewords, axis=1) == 8]
-        for octad in octads:
-            indices = np.where(octad == 1)[0]
-            # There are 2^7 sign combinations such that sum of minus signs is even
-            for i in range(256):
-                signs = np.array([1 if (i >> j) & 1 == 0 else -1 for j in range(8)])
-                if np.sum(signs == -1) % 2 == 0:
-                    v = np.zeros(24)
-                    v[indices] = 2 * signs
-                    minimal_vectors.append(v)
+        support = np.nonzero(octads)[1].reshape(len(octads), 8)
+        minus = (np.arange(256)[:, None] >> np.arange(8)) & 1
+        octad_signs = (2 - 4 * minus[minus.sum(axis=1) % 2 == 0]).astype(np.int8)
+        shape2 = np.zeros((len(octads), len(octad_signs), 24), dtype=np.int8)
+        shape2[np.arange(len(octads))[:, None, None],
+               np.arange(len(octad_signs))[None, :, None],
+               support[:, None, :]] = octad_signs[None, :, :]
 
         # Shape 3: (3, 1^23) -> 98,304 vectors
-        for i in range(24):
-            for codeword in codewords:
-                v = np.array([1 if b == 0 else -1 for b in codeword], dtype=float)
-                if codeword[i] == 0:
-                    v[i] = -3
-                else:
-                    v[i] = 3
-                minimal_vectors.append(v)
-                
-        return np.array(minimal_vectors)
+        # (-1)^c with the coordinate i scaled by -3
+        base = (1 - 2 * codewords).astype(np.int8)
+        shape3 = np.broadcast_to(base, (24,) + base.shape).copy()
+        shape3[np.arange(24), :, np.arange(24)] *= -3
+
+        return np.concatenate((shape1.reshape(-1, 24), shape2.reshape(-1, 24), shape3.reshape(-1, 24)))
+
+    def get_neighbor_offsets(self):
+        """
+        Returns the offsets v (int8 rows, norm^2 = 32) such that q + v are the
+        nearest neighbors of any point q this decoder outputs. For the ML
+        decoders these are the Leech minimal vectors. The coset decoder snaps
+        onto 2c + 4Z^24, whose norm-32 vectors are the (4, 4, 0^22) shapes plus
+        every octad with all 2^8 sign patterns (195,408 rows).
+        """
+        if self.decoder == "coset":
+            return tables.leech_coset_neighbors()
+        return tables.leech_minimal_vectors()
+
+    def _enumerate_coset_neighbors(self):
+        """ Builds the norm-32 vectors of 2c + 4Z^24 (used to populate the table cache). """
+        codewords = self.golay.get_all_codewords()
+        shape1 = tables.leech_minimal_vectors()[:24 * 23 // 2 * 4]
+
+        octads = codewords[np.sum(codewords, axis=1) == 8]
+        support = np.nonzero(octads)[1].reshape(len(octads), 8)
+        octad_signs = (2 - 4 * ((np.arange(256)[:, None] >> np.arange(8)) & 1)).astype(np.int8)
+        shape2 = np.zeros((len(octads), 256, 24), dtype=np.int8)
+        shape2[np.arange(len(octads))[:, None, None],
+               np.arange(256)[None, :, None],
+               support[:, None, :]] = octad_signs[None, :, :]
+
+        return np.concatenate((shape1, shape2.reshape(-1, 24)))
 
     def quantify(self, x):
         """ 
         Finds the closest point in the Leech Lattice to an arbitrary 24D vector x.
         Optimized NumPy implementation for batch-like performance.
         """
+        if self.decoder != "coset":
+            x = np.asarray(x, dtype=np.float64).reshape(1, 24)
+            return self.quantify_batch(x)[0].astype(np.float64)
+
         if not hasattr(self, '_c2_cache'):
-            self._c2_cache = 2 * self.golay.get_all_codewords()
+            self._c2_cache = tables.golay_c2()
             
         if np.linalg.norm(x) < 0.1:
             return np.zeros(24)
@@ -258,36 +384,378 @@ class LeechLattice(Lattice):
         
         return p_candidates[best_idx]
 
-    def quantify_batch(self, X):
+    def quantify_batch(self, X, out=None, max_memory_bytes=None, n_threads=None):
         """ 
         Finds the closest points in the Leech Lattice for a batch of 24D vectors.
         Optimized for CUDA-like speeds using heavy NumPy vectorization and cache-aware chunking.
+
+        X may be any (N, 24) array, including an np.memmap larger than RAM.
+        Results go into `out` if a preallocated (N, 24) array is given (it may also
+        be a memmap). max_memory_bytes caps the scratch memory: chunks are sized to
+        fit the budget and scratch buffers are reused across chunks, so peak memory
+        stays flat regardless of N.
+
+        With n_threads > 1 the batch is split into contiguous slices that run on a
+        persistent thread pool. The heavy NumPy kernels release the GIL, all threads
+        share the read-only codeword tables, and each writes its own slice of `out`,
+        so there is no pickling or per-worker table copy. The memory budget is
+        shared between the threads.
         """
-        if not hasattr(self, '_c2_cache'):
-            # Pre-compute and cast to float32 for faster math
-            self._c2_cache = (2 * self.golay.get_all_codewords()).astype(np.float32)
-            
+        X = np.asarray(X)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
         N = X.shape[0]
-        # Smaller chunk size for pure NumPy to avoid massive memory allocations
-        # (chunk_size * 4096 * 24 * 4 bytes)
-        chunk_size = 200 
-        all_best_p = []
-        
+        if out is None:
+            out = np.empty((N, 24), dtype=np.float32)
+        elif out.shape != (N, 24):
+            raise ValueError(f"out must have shape {(N, 24)}, got {out.shape}")
+
+        n_threads = max(1, min(int(n_threads or 1), N))
+        if max_memory_bytes is not None:
+            max_memory_bytes = max_memory_bytes // n_threads
+        chunk_size = self.chunk_rows(max_memory_bytes)
+
+        def run(start, stop):
+            scratch = {}
+            for i in range(start, stop, chunk_size):
+                end = min(i + chunk_size, stop)
+                self._quantify_chunk(X[i:end], out[i:end], scratch)
+
+        if n_threads == 1:
+            run(0, N)
+            return out
+
+        bounds = np.linspace(0, N, n_threads + 1).astype(int)
+        pool = _thread_pool(n_threads)
+        futures = [pool.submit(run, a, b) for a, b in zip(bounds[:-1], bounds[1:]) if b > a]
+        for f in futures:
+            f.result()
+        return out
+
+    def quantify_stream(self, chunks, max_memory_bytes=None, n_threads=None):
+        """
+        Streaming quantization at a flat memory ceiling.
+        `chunks` is either an (N, 24) array / memmap, which is sliced into
+        budget-sized chunks, or any iterable (e.g. a generator) of (n, 24) arrays.
+        Yields one float32 array of lattice points per chunk, in order.
+        n_threads > 1 quantizes each chunk on the shared thread pool.
+        """
+        chunk_size = self.chunk_rows(max_memory_bytes)
+        if isinstance(chunks, np.ndarray):
+            source = chunks
+            chunks = (source[i:i + chunk_size] for i in range(0, len(source), chunk_size))
+
+        scratch = {}
+        for chunk in chunks:
+            chunk = np.asarray(chunk)
+            if chunk.ndim == 1:
+                chunk = chunk.reshape(1, -1)
+            out = np.empty((chunk.shape[0], 24), dtype=np.float32)
+            if n_threads and n_threads > 1:
+                yield self.quantify_batch(chunk, out=out, max_memory_bytes=max_memory_bytes, n_threads=n_threads)
+                continue
+            for i in range(0, chunk.shape[0], chunk_size):
+                self._quantify_chunk(chunk[i:i + chunk_size], out[i:i + chunk_size], scratch)
+            yield out
+
+    def chunk_rows(self, max_memory_bytes=None):
+        """ Rows per chunk for this decoder: the default chunk size, or what fits in the budget. """
+        if max_memory_bytes is None:
+            return self._DEFAULT_CHUNK_ROWS[self.decoder]
+        return max(1, int(max_memory_bytes) // self._BYTES_PER_ROW[self.decoder])
+
+    def _quantify_chunk(self, chunk, out, scratch):
+        """ Quantizes one chunk into `out`, reusing the buffers kept in `scratch`. """
+        if self.decoder == "golay":
+            out[...] = self._decode_golay_block(np.asarray(chunk, dtype=np.float64))
+            return
+        if self.decoder == "exhaustive":
+            P, d = self._exhaustive_candidates(np.asarray(chunk, dtype=np.float64))
+            out[...] = P[np.arange(len(chunk)), np.argmin(d, axis=1)]
+            return
+
+        if not hasattr(self, '_c2_cache'):
+            # Shared float32 table for faster math
+            self._c2_cache = tables.golay_c2()
         C = self._c2_cache # (4096, 24)
-        
-        for i in range(0, N, chunk_size):
-            chunk = X[i:i+chunk_size].astype(np.float32)
-            
-            # BROADCASTING: (chunk_len, 1, 24) - (1, 4096, 24)
-            # Snapping logic: p = 2 * round((x - 2c)/4)*2 + 2c
-            diff = chunk[:, np.newaxis, :] - C
-            p_candidates = 2.0 * np.round(diff / 4.0) * 2.0 + C
-            
-            # Distance: (chunk_len, 4096)
-            d_diff = chunk[:, np.newaxis, :] - p_candidates
-            dists_sq = np.einsum('ijk,ijk->ij', d_diff, d_diff)
-            
-            best_indices = np.argmin(dists_sq, axis=1)
-            all_best_p.append(p_candidates[np.arange(len(chunk)), best_indices])
-            
-        return np.vstack(all_best_p)
+
+        n = chunk.shape[0]
+        if scratch.get("rows", 0) < n:
+            # (chunk_size * 4096 * 24 * 4 bytes) per buffer, allocated once per run
+            scratch["rows"] = n
+            scratch["cand"] = np.empty((n,) + C.shape, dtype=np.float32)
+            scratch["diff"] = np.empty((n,) + C.shape, dtype=np.float32)
+            scratch["dists"] = np.empty((n, C.shape[0]), dtype=np.float32)
+        cand, diff, dists_sq = scratch["cand"][:n], scratch["diff"][:n], scratch["dists"][:n]
+        chunk = np.asarray(chunk, dtype=np.float32)
+
+        # BROADCASTING: (chunk_len, 1, 24) - (1, 4096, 24)
+        # Snapping logic: p = 2 * round((x - 2c)/4)*2 + 2c
+        np.subtract(chunk[:, np.newaxis, :], C, out=cand)
+        cand *= 0.25
+        np.round(cand, out=cand)
+        cand *= 4.0
+        cand += C
+
+        # Distance: (chunk_len, 4096)
+        np.subtract(chunk[:, np.newaxis, :], cand, out=diff)
+        np.einsum('ijk,ijk->ij', diff, diff, out=dists_sq)
+
+        best_indices = np.argmin(dists_sq, axis=1)
+        out[...] = cand[np.arange(n), best_indices]
+
+    def quantify_topk(self, X, k):
+        """
+        Multi-probe (list) decoding: returns the k nearest lattice points (of the
+        lattice this decoder snaps to) for every input, sorted by distance. The
+        first candidate equals quantify_batch(X).
+        Returns (points, dists_sq) with shapes (N, k, 24) and (N, k).
+
+        Only the k cosets with the nearest best points can hold one of the k
+        nearest points. Those are scored as in quantify_batch, then the points
+        inside them (including q +- 4e_i in q's own coset) are enumerated
+        best-first by _nearest_in_cosets.
+        """
+        X = np.asarray(X)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        num_cosets = 4096 if self.decoder == "coset" else 8192
+        if not 1 <= k <= num_cosets:
+            raise ValueError(f"k must be between 1 and {num_cosets}")
+
+        N = X.shape[0]
+        points = np.empty((N, k, 24), dtype=np.float32)
+        dists = np.empty((N, k), dtype=np.float64)
+        top = np.empty((N, k), dtype=np.int64)
+
+        if self.decoder == "golay":
+            X = X.astype(np.float64, copy=False)
+            for i in range(0, N, self._ML_BLOCK):
+                top[i:i + self._ML_BLOCK] = self._topk_golay_cosets(X[i:i + self._ML_BLOCK], k)
+        else:
+            if self.decoder == "exhaustive":
+                X = X.astype(np.float64, copy=False)
+                chunk_size = 32
+            else:
+                if not hasattr(self, '_c2_cache'):
+                    self._c2_cache = tables.golay_c2()
+                chunk_size = 200
+            for i in range(0, N, chunk_size):
+                if self.decoder == "exhaustive":
+                    chunk = X[i:i + chunk_size]
+                    _, dists_sq = self._exhaustive_candidates(chunk)
+                else:
+                    chunk = X[i:i + chunk_size].astype(np.float32)
+                    C = self._c2_cache
+                    p_candidates = 2.0 * np.round((chunk[:, np.newaxis, :] - C) / 4.0) * 2.0 + C
+                    d_diff = chunk[:, np.newaxis, :] - p_candidates
+                    dists_sq = np.einsum('ijk,ijk->ij', d_diff, d_diff)
+                top[i:i + len(chunk)] = np.argpartition(dists_sq, k - 1, axis=1)[:, :k]
+
+        # Coset j is h + 2c + 4z: h and the parity of sum(z) split the ML decoders' 8192 cosets
+        C2 = 2.0 * self._golay_table()[0]
+        half, codeword = np.divmod(top, 4096)
+        for n in range(N):
+            bases = half[n][:, None] + C2[codeword[n]]
+            parity = half[n] if self.decoder != "coset" else None
+            points[n], dists[n] = self._nearest_in_cosets(np.asarray(X[n], dtype=np.float64), bases, k, parity)
+        return points, dists
+
+    @staticmethod
+    def _nearest_in_cosets(x, bases, k, parity=None):
+        """
+        The k nearest points to x among the cosets bases[j] + 4Z^24, restricted
+        to sum(z) = parity[j] (mod 2) when parity is given. Returns
+        (points (k, 24), dists_sq (k,)), nearest first.
+
+        Every coordinate is an independent 1D problem whose roundings
+        z = r, r+s, r-s, r+2s, r-2s, ... (s the sign of the residual) have
+        nondecreasing cost, so the points of a coset are rank vectors over 24
+        sorted lists. They are enumerated best-first with a heap, reaching each
+        rank vector only by raising coordinates in index order so no point is
+        visited twice; points with the wrong z parity are skipped.
+        """
+        T = (x[None, :] - bases) * 0.25
+        R = np.rint(T)
+        E = T - R
+        S = np.where(E >= 0, 1, -1)
+        wrong = np.zeros(len(bases), dtype=np.int64) if parity is None else (R.sum(axis=1).astype(np.int64) - parity) & 1
+        E_rows, S_rows = E.tolist(), S.tolist()
+
+        def cost(j, i, rank):
+            # Squared distance of rank-th rounding of coordinate i in coset j
+            o = S_rows[j][i] * ((rank + 1) // 2) * (1 if rank % 2 else -1)
+            return 16.0 * (E_rows[j][i] - o) ** 2
+
+        zero = (0,) * 24
+        heap = [(16.0 * float(np.dot(E[j], E[j])), j, 0, int(wrong[j]), zero) for j in range(len(bases))]
+        heapq.heapify(heap)
+        found = []
+        while len(found) < k:
+            d, j, last, odd, ranks = heapq.heappop(heap)
+            if not odd or parity is None:
+                found.append((d, j, ranks))
+            for i in range(last, 24):
+                rank = ranks[i] + 1
+                raised = ranks[:i] + (rank,) + ranks[i + 1:]
+                d_i = d + cost(j, i, rank) - cost(j, i, rank - 1)
+                # Odd ranks step |z_i - r_i| up by one, flipping the parity of sum(z)
+                heapq.heappush(heap, (d_i, j, i, odd ^ (rank % 2), raised))
+
+        points = np.empty((k, 24))
+        for n, (_, j, ranks) in enumerate(found):
+            rank = np.array(ranks)
+            offset = S[j] * ((rank + 1) // 2) * np.where(rank % 2 == 1, 1, -1)
+            points[n] = bases[j] + 4.0 * (R[j] + offset)
+        return points, np.sum((x[None, :] - points) ** 2, axis=1)
+
+    def _golay_table(self):
+        """
+        Returns the tables used by the ML decoders: the (4096, 24) codeword matrix,
+        its transpose augmented with a row of ones (so one matmul yields full codeword
+        metrics), and a (64, 64) table of popcount(a & b) parities.
+        """
+        if not hasattr(self, '_codeword_table'):
+            C = self.golay.get_all_codewords().astype(np.float64)
+            C_aug = np.ascontiguousarray(np.vstack((C.T, np.ones((1, C.shape[0])))))
+            a = np.arange(64)
+            bits = (a[:, None] & a[None, :])
+            popcount = sum((bits >> j) & 1 for j in range(6))
+            self._codeword_table = (C, C_aug, popcount & 1)
+        return self._codeword_table
+
+    def _golay_scores(self, X):
+        """
+        Scores all 2 x 4096 (half, codeword) cosets for a block of inputs.
+        Returns the flat (n, 8192) metric (a lower bound for wrong-parity cosets)
+        plus the rounding state needed to repair and reconstruct points.
+        """
+        C, C_aug, parity_table = self._golay_table()
+        G = self.golay.generator_matrix
+        n = X.shape[0]
+
+        # T[n, h, b, i]: scaled residual for half h when codeword bit c_i = b,
+        # i.e. (x_i - h - 2b) / 4
+        T = (X[:, None, None, :] - self._ML_OFFSETS) * 0.25
+        R = np.rint(T)
+        E = T - R
+        D = 16.0 * E * E                         # squared distance of the rounded coordinate
+        repair = 16.0 - 32.0 * np.abs(E)         # extra cost of rounding the other way
+        par = R.astype(np.int64) & 1
+
+        # Codeword metrics for both halves: [D1 - D0 | sum(D0)] @ [C^T ; 1]
+        M = np.concatenate((D[:, :, 1] - D[:, :, 0], D[:, :, 0].sum(axis=2, keepdims=True)), axis=2)
+        cost = M @ C_aug                         # (n, 2, 4096)
+
+        # z-parity of codeword k is p0 ^ parity(k & w), w = G (par1 ^ par0) over GF(2)
+        w_bits = ((par[:, :, 1] ^ par[:, :, 0]) @ G.T) & 1
+        w = w_bits @ (1 << np.arange(12))
+        flip = (par[:, :, 0].sum(axis=2) & 1) ^ self._ML_HALF_PARITY
+        lo = parity_table[w & 63] ^ flip[:, :, None]
+        hi = parity_table[w >> 6]
+
+        state = {"R": R, "E": E, "repair": repair, "hi": hi, "lo": lo,
+                 "repaired": np.zeros((n, 2 * C.shape[0]), dtype=bool)}
+        return cost.reshape(n, -1), state
+
+    def _golay_is_bad(self, state, r, k):
+        """ True where coset k (flat index) of row r has rounded z with the wrong parity. """
+        h, kc = np.divmod(k, self._golay_table()[0].shape[0])
+        return (state["hi"][r, h, kc >> 6] ^ state["lo"][r, h, kc & 63]) == 1
+
+    def _golay_repair(self, flat, state, r, k):
+        """ Turns the lower bounds flat[r, k] into exact costs for wrong-parity cosets. """
+        C = self._golay_table()[0]
+        h, kc = np.divmod(k, C.shape[0])
+        repair = state["repair"]
+        fix = np.where(C[kc] > 0, repair[r, h, 1], repair[r, h, 0]).min(axis=-1)
+        flat[r, k] += fix
+        state["repaired"][r, k] = True
+
+    def _golay_points(self, state, r, k):
+        """ Reconstructs the best lattice point inside coset k (flat index) for rows r. """
+        C = self._golay_table()[0]
+        R, E = state["R"], state["E"]
+        h, kc = np.divmod(k, C.shape[0])
+        c = C[kc] > 0
+        Z = np.where(c, R[r, h, 1], R[r, h, 0])
+        needs_fix = self._golay_is_bad(state, r, k)
+        if np.any(needs_fix):
+            E_w = np.where(c[needs_fix], E[r[needs_fix], h[needs_fix], 1], E[r[needs_fix], h[needs_fix], 0])
+            j = np.argmax(np.abs(E_w), axis=1)
+            step = np.where(E_w[np.arange(len(j)), j] >= 0, 1.0, -1.0)
+            Z_fix = Z[needs_fix]
+            Z_fix[np.arange(len(j)), j] += step
+            Z[needs_fix] = Z_fix
+        return h[:, None] + 2.0 * c + 4.0 * Z
+
+    def _decode_golay_block(self, X):
+        """
+        Maximum-likelihood Leech decoding via soft-decision Golay decoding.
+
+        Every Leech point is h + 2c + 4z with h in {0, 1}, c a Golay codeword and
+        sum(z) = h (mod 2). For a fixed coordinate, half and codeword bit, the best
+        z_i is a plain rounding, so the cost of a codeword splits into a per-coordinate
+        metric (scored for all 4096 codewords with one matrix product) plus a parity
+        repair: when the rounded z has the wrong parity, the cheapest single-coordinate
+        move is added. The parity of every codeword is a linear function of its 12
+        message bits, so it comes from a 64 x 64 lookup table instead of arithmetic.
+        Repairs are evaluated lazily on the current best candidate, which keeps the
+        search exact while usually touching only one or two codewords.
+        """
+        flat, state = self._golay_scores(X)
+        best = np.empty(X.shape[0], dtype=np.int64)
+
+        # Lazy branch and bound: the metric is a lower bound for wrong-parity
+        # codewords, so repair the current argmin until it is an exact cost.
+        active = np.arange(X.shape[0])
+        while True:
+            k = np.argmin(flat[active], axis=1)
+            done = ~self._golay_is_bad(state, active, k) | state["repaired"][active, k]
+            best[active[done]] = k[done]
+            if done.all():
+                break
+            active, k = active[~done], k[~done]
+            self._golay_repair(flat, state, active, k)
+
+        return self._golay_points(state, np.arange(X.shape[0]), best)
+
+    def _topk_golay_cosets(self, X, k):
+        """ Flat indices of the k cosets with the nearest best points, for a block of inputs. """
+        flat, state = self._golay_scores(X)
+
+        # Same bound as the k = 1 search: repair every wrong-parity coset that
+        # reaches the current top k until the top k are all exact costs.
+        active = np.arange(X.shape[0])
+        while len(active):
+            top = np.argpartition(flat[active], k - 1, axis=1)[:, :k]
+            r = np.broadcast_to(active[:, None], top.shape)
+            pending = self._golay_is_bad(state, r, top) & ~state["repaired"][r, top]
+            if not pending.any():
+                break
+            self._golay_repair(flat, state, r[pending], top[pending])
+            active = active[pending.any(axis=1)]
+
+        return np.argpartition(flat, k - 1, axis=1)[:, :k]
+
+    def _exhaustive_candidates(self, X):
+        """
+        Runs a D24 decode (round, then fix parity on the worst coordinate) inside
+        each of the 2 x 4096 cosets. Returns (n, 8192, 24) points and their
+        squared distances, half 0 first.
+        """
+        C = 2.0 * self._golay_table()[0]
+        points, dists = [], []
+        for h in (0.0, 1.0):
+            T = (X[:, None, :] - h - C) / 4.0
+            Z = np.rint(T)
+            E = T - Z
+            wrong = np.mod(Z.sum(axis=2), 2.0) != h
+            j = np.argmax(np.abs(E), axis=2)
+            step = np.where(np.take_along_axis(E, j[:, :, None], axis=2)[:, :, 0] >= 0, 1.0, -1.0)
+            a, b = np.nonzero(wrong)
+            Z[a, b, j[a, b]] += step[a, b]
+            P = h + C + 4.0 * Z
+            points.append(P)
+            dists.append(np.sum((X[:, None, :] - P) ** 2, axis=2))
+        return np.concatenate(points, axis=1), np.concatenate(dists, axis=1)
@@ -0,0 +1,141 @@
+"""
+Process-wide precomputed lattice tables.
+
+Building the Golay codeword matrix, the 2c coset cache, the E8 roots and the
+Leech minimal vectors is pure overhead that every LeechLattice, LeechDB,
+LeechHash, router and worker process used to repeat on its own. This module
+builds each table once per process and persists it to a versioned .npy cache
+on disk. Later processes (including multiprocessing workers) open the cached
+files with mmap_mode='r', so start-up skips the rebuild and all processes share
+one page-cached copy of the data.
+
+The cache directory defaults to ~/.cache/e8leech and can be overridden with the
+E8LEECH_CACHE_DIR environment variable or set_cache_dir(). Set it to an empty
+string to keep tables in memory only.
+"""
+import os
+import threading
+import numpy as np
+
+# Bump whenever a table's construction or layout changes; old files are ignored.
+TABLES_VERSION = 1
+
+_TABLES = {}
+_LOCK = threading.RLock()  # builders may request other tables
+_cache_dir = os.environ.get("E8LEECH_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "e8leech"))
+
+
+def _build_golay_codewords():
+    from core.lattices import GolayCode
+    return GolayCode()._enumerate_codewords().astype(np.int8)
+
+def _build_golay_c2():
+    return (2 * get_table("golay_codewords")).astype(np.float32)
+
+def _build_e8_roots():
+    from core.lattices import E8Lattice
+    return E8Lattice()._enumerate_roots()
+
+def _build_leech_minimal_vectors():
+    from core.lattices import LeechLattice
+    return LeechLattice()._enumerate_minimal_vectors().astype(np.int8)
+
+def _build_leech_coset_neighbors():
+    from core.lattices import LeechLattice
+    return LeechLattice()._enumerate_coset_neighbors().astype(np.int8)
+
+_BUILDERS = {
+    "golay_codewords": _build_golay_codewords,
+    "golay_c2": _build_golay_c2,
+    "e8_roots": _build_e8_roots,
+    "leech_minimal_vectors": _build_leech_minimal_vectors,
+    "leech_coset_neighbors": _build_leech_coset_neighbors,
+}
+
+
+def set_cache_dir(path):
+    """ Points the on-disk cache at `path` (None or "" disables it) and drops loaded tables. """
+    global _cache_dir
+    with _LOCK:
+        _cache_dir = path or ""
+        _TABLES.clear()
+
+def cache_path(name):
+    """ Returns the versioned .npy path for a table, or None if disk caching is off. """
+    if not _cache_dir:
+        return None
+    return os.path.join(_cache_dir, f"{name}_v{TABLES_VERSION}.npy")
+
+def _load_or_build(name):
+    path = cache_path(name)
+    if path is not None and os.path.exists(path):
+        try:
+            return np.load(path, mmap_mode='r')
+        except (OSError, ValueError):
+            pass  # Corrupt or truncated file: rebuild below
+
+    table = _BUILDERS[name]()
+    if path is None:
+        table.setflags(write=False)
+        return table
+
+    try:
+        os.makedirs(_cache_dir, exist_ok=True)
+        # Write to a private temp file then rename, so concurrent workers never
+        # observe a half-written table.
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.save(f, table)
+        os.replace(tmp_path, path)
+        return np.load(path, mmap_mode='r')
+    except OSError:
+        table.setflags(write=False)
+        return table
+
+def get_table(name):
+    """ Returns the shared, read-only table `name`, building or loading it on first use. """
+    table = _TABLES.get(name)
+    if table is not None:
+        return table
+    if name not in _BUILDERS:
+        raise KeyError(f"Unknown lattice table '{name}'. Available: {sorted(_BUILDERS)}")
+    with _LOCK:
+        if name not in _TABLES:
+            _TABLES[name] = _load_or_build(name)
+        return _TABLES[name]
+
+def warm(names=None):
+    """ Loads (and if needed builds and caches) the given tables, or all of them. """
+    for name in (names or _BUILDERS):
+        get_table(name)
+
+def clear(disk=False):
+    """ Drops the in-process tables; with disk=True also deletes this version's cache files. """
+    with _LOCK:
+        _TABLES.clear()
+        if disk:
+            for name in _BUILDERS:
+                path = cache_path(name)
+                if path is not None and os.path.exists(path):
+                    os.remove(path)
+
+
+def golay_codewords():
+    """ (4096, 24) int8 matrix of all Golay codewords, row i encodes the bits of i. """
+    return get_table("golay_codewords")
+
+def golay_c2():
+    """ (4096, 24) float32 coset representatives 2c used by the Leech decoders. """
+    return get_table("golay_c2")
+
+def e8_roots():
+    """ (240, 8) float64 E8 roots. """
+    return get_table("e8_roots")
+
+def leech_minimal_vectors():
+    """ (196560, 24) int8 Leech minimal vectors (norm^2 = 32 in this scaling). """
+    return get_table("leech_minimal_vectors")
+
+def leech_coset_neighbors():
+    """ (195408, 24) int8 norm-32 vectors of 2c + 4Z^24, the neighbors of coset-decoded points. """
+    return get_table("leech_coset_neighbors")
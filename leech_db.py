@@ -1,33 +1,330 @@
+import os
+import time
+import queue
 import sqlite3
+import threading
+import contextlib
+import urllib.parse
 import numpy as np
 import json
 from core.lattices import LeechLattice
+from core import codec
+from core.keyset import FingerprintSet
+from core.cache import LRUCache
 
 class LeechDB:
     """
     Persistent storage for Leech Lattice indexed embeddings using SQLite.
+
+    Bucket keys are packed 48-byte BLOBs from core.codec. Databases created
+    before the binary format keep their comma-joined TEXT keys; the format is
+    recorded in the `meta` table and detected on open.
+
+    Concurrency: `conn` is the single writer connection; every write goes
+    through it under a lock, so ingest is serialized. Reads check a read-only
+    connection out of a bounded pool (at most `pool_size`, opened lazily) and
+    return it when done; WAL mode lets them run concurrently with each other
+    and with ingest, and readers only see committed data. When every pooled
+    connection is busy, further readers wait for one to be returned. In-memory
+    databases have no separate readers and read through the writer.
+
+    Result cache: with cache_size > 0, query_exact and query_neighborhood
+    results (without top_k) are kept in an LRU cache keyed by the packed
+    centroid key. Every commit drops the exact entries of the ingested buckets
+    and the neighborhood entries whose center is within distance sqrt(32) of
+    one; cache_ttl bounds staleness against writes from other connections.
+
+    Bucket statistics: every ingest transaction also maintains a per-bucket
+    label count (bucket_stats) and global counters (stats), so occupancy,
+    skew and the largest buckets are available through bucket_stats(),
+    largest_buckets() and bucket_histogram() without touching the label data.
+
+    Decoder (chosen at creation, recorded in `meta`): the LeechLattice decoder
+    that maps vectors to bucket keys ("coset" by default, "golay" for the much
+    faster ML decoder). Keys from different decoders are not interchangeable,
+    so reopening a DB with a different explicit decoder raises ValueError;
+    decoder=None uses the recorded one.
+
+    Residuals (postings storage only, chosen at creation, recorded in `meta`):
+    with residuals="float16" or "int8" each label also keeps its quantization
+    residual x - q as a compact code (see codec.encode_residuals). Queries
+    with top_k re-rank their candidates by distance to the reconstructed
+    vector q + r and return only the nearest top_k labels. Labels indexed
+    without a vector are ranked by distance to their bucket centroid.
+
+    Labels are stored as strings: every label is converted with str() on
+    ingest (so 7 comes back as '7'), and None is rejected with a ValueError.
+
+    Storage formats (chosen at creation, recorded in `meta`):
+      - "postings": normalized (centroid_id, label_id) posting table plus a
+                    label dictionary. Inserts are append-only B-tree inserts, so
+                    ingest cost does not depend on bucket size. Default for new DBs.
+      - "json":     legacy one-row-per-bucket JSON label arrays. Existing DBs keep
+                    it until migrate_to_postings() is called.
     """
-    def __init__(self, db_path="leech_index.db"):
-        self.leech = LeechLattice()
-        self.conn = sqlite3.connect(db_path)
-        self._setup_db()
+    STORAGE_FORMATS = ("postings", "json")
+
+    # Max bound parameters per IN (...) lookup
+    _IN_BATCH = 500
+    # Larger key sets are looked up through a temp-table join instead
+    _JOIN_THRESHOLD = 4 * _IN_BATCH
+    NEIGHBORHOOD_STRATEGIES = ("memory", "sql")
+
+    # Per-connection page cache and memory map (read paths are mostly random B-tree probes)
+    CACHE_SIZE_KB = 64 * 1024
+    MMAP_SIZE = 256 * 1024 * 1024
+
+    def __init__(self, db_path="leech_index.db", storage="postings", residuals=None, cache_size=0, cache_ttl=None,
+                 pool_size=8, decoder=None):
+        if storage not in self.STORAGE_FORMATS:
+            raise ValueError(f"Unknown storage format '{storage}'. Use one of {self.STORAGE_FORMATS}.")
+        if residuals is not None and residuals not in codec.RESIDUAL_FORMATS:
+            raise ValueError(f"Unknown residual format '{residuals}'. Use one of {codec.RESIDUAL_FORMATS}.")
+        if decoder is not None and decoder not in LeechLattice.DECODERS:
+            raise ValueError(f"Unknown decoder '{decoder}'. Use one of {LeechLattice.DECODERS}.")
+        self.db_path = db_path
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._tune_connection(self.conn)
+        self._write_lock = threading.RLock()
+        # Idle read-only connections, and how many have been opened in total
+        self.pool_size = pool_size
+        self._pool = queue.LifoQueue()
+        self._pool_lock = threading.Lock()
+        self._num_readers = 0
+        self._setup_db(storage, residuals, decoder)
+        self.leech = LeechLattice(decoder=self.decoder)
+        # Occupied-bucket fingerprints, loaded on the first neighborhood query
+        self._occupied = None
+        self._neighbor_fps = None
+        self.cache = LRUCache(cache_size, cache_ttl)
+        # Keys appended since the last commit, and a counter bumped by every commit that wrote any
+        self._dirty_keys = []
+        self._cache_generation = 0
+        self._cache_lock = threading.Lock()
 
-    def _setup_db(self):
+    def _setup_db(self, storage="postings", residuals=None, decoder=None):
         cursor = self.conn.cursor()
         # Enable WAL mode for high-concurrency and faster writes
         cursor.execute("PRAGMA journal_mode=WAL")
         cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'buckets'")
+        has_buckets = cursor.fetchone() is not None
+        cursor.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+
+        # Pre-existing databases without meta entries are legacy JSON buckets
+        legacy = has_buckets and self._get_meta("storage") is None
+        self.storage = self._get_meta("storage") or ("json" if legacy else storage)
+        self._set_meta("storage", self.storage)
+
+        self.key_format = self._get_meta("key_format")
+        if self.key_format is None:
+            # Legacy databases that already hold rows use the comma-joined text keys
+            has_rows = legacy and cursor.execute("SELECT 1 FROM buckets LIMIT 1").fetchone() is not None
+            self.key_format = "text" if has_rows else "binary"
+            self._set_meta("key_format", self.key_format)
+
+        if self.storage == "json":
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS buckets (
+                    centroid_id BLOB PRIMARY KEY,
+                    labels TEXT
+                )
+            """)
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_centroid ON buckets(centroid_id)")
+        else:
+            self._create_postings_tables(cursor)
+        self._create_stats_tables(cursor)
+        self._create_job_tables(cursor)
+
+        # Like the storage format, the residual format is fixed once recorded
+        if self._get_meta("residuals") is None:
+            if residuals and self.storage != "postings":
+                raise ValueError("Residuals require postings storage")
+            self._set_meta("residuals", residuals or "")
+        self.residuals = self._get_meta("residuals") or None
+
+        recorded = self._get_meta("decoder")
+        if recorded is None:
+            # Databases from before the decoder was recorded were all built with the coset decoder
+            has_rows = cursor.execute("SELECT 1 FROM bucket_stats LIMIT 1").fetchone() is not None
+            recorded = "coset" if has_rows else (decoder or "coset")
+        if decoder is not None and decoder != recorded:
+            self.conn.close()
+            raise ValueError(f"{self.db_path} was indexed with the '{recorded}' decoder, not '{decoder}'")
+        self._set_meta("decoder", recorded)
+        self.decoder = recorded
+        if self.residuals:
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS residuals (
+                    label_id INTEGER PRIMARY KEY,
+                    centroid_id BLOB NOT NULL,
+                    code BLOB NOT NULL,
+                    scale REAL NOT NULL
+                )
+            """)
+        self.conn.commit()
+
+    def _tune_connection(self, conn):
+        conn.execute(f"PRAGMA cache_size=-{self.CACHE_SIZE_KB}")
+        conn.execute(f"PRAGMA mmap_size={self.MMAP_SIZE}")
+
+    @contextlib.contextmanager
+    def _reader(self):
+        """
+        Checks a read-only connection out of the pool for the duration of the
+        `with` block. Opens a new one while fewer than pool_size exist, else
+        waits for one to be returned. Results must be fetched inside the block.
+        """
+        if self.db_path in ("", ":memory:"):
+            yield self.conn
+            return
+        try:
+            conn = self._pool.get_nowait()
+        except queue.Empty:
+            with self._pool_lock:
+                can_open = self._num_readers < self.pool_size
+                if can_open:
+                    self._num_readers += 1
+            if not can_open:
+                conn = self._pool.get()
+            else:
+                try:
+                    conn = self._open_reader()
+                except Exception:
+                    with self._pool_lock:
+                        self._num_readers -= 1
+                    raise
+        try:
+            yield conn
+        finally:
+            # Temp-table writes open an implicit transaction; ending it drops the
+            # read snapshot so the next borrower sees new commits (and WAL can checkpoint)
+            if conn.in_transaction:
+                conn.rollback()
+            self._pool.put(conn)
+
+    def _open_reader(self):
+        uri = "file:" + urllib.parse.quote(os.path.abspath(self.db_path)) + "?mode=ro"
+        conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        self._tune_connection(conn)
+        return conn
+
+    def _create_postings_tables(self, cursor):
         cursor.execute("""
-            CREATE TABLE IF NOT EXISTS buckets (
-                centroid_id TEXT PRIMARY KEY,
-                labels TEXT
+            CREATE TABLE IF NOT EXISTS label_dict (
+                label_id INTEGER PRIMARY KEY,
+                label TEXT UNIQUE NOT NULL
             )
         """)
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_centroid ON buckets(centroid_id)")
-        self.conn.commit()
+        # Clustered on (centroid_id, label_id): a bucket is one contiguous range
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS postings (
+                centroid_id BLOB NOT NULL,
+                label_id INTEGER NOT NULL,
+                PRIMARY KEY (centroid_id, label_id)
+            ) WITHOUT ROWID
+        """)
+
+    def _create_stats_tables(self, cursor):
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'bucket_stats'")
+        exists = cursor.fetchone() is not None
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS bucket_stats (
+                centroid_id BLOB PRIMARY KEY,
+                count INTEGER NOT NULL
+            ) WITHOUT ROWID
+        """)
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_bucket_stats_count ON bucket_stats(count)")
+        cursor.execute("CREATE TABLE IF NOT EXISTS stats (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        cursor.execute("CREATE TEMP TABLE IF NOT EXISTS stat_delta (centroid_id BLOB, delta INTEGER)")
+        if not exists:
+            # Databases from before the stats tables: one-time backfill
+            self._rebuild_bucket_stats(cursor)
+
+    def _rebuild_bucket_stats(self, cursor):
+        """ Recomputes bucket_stats and the counters from the stored buckets (full scan). """
+        cursor.execute("DELETE FROM bucket_stats")
+        if self.storage == "postings":
+            cursor.execute("""
+                INSERT INTO bucket_stats (centroid_id, count)
+                SELECT centroid_id, COUNT(*) FROM postings GROUP BY centroid_id
+            """)
+        else:
+            cursor.execute("""
+                INSERT INTO bucket_stats (centroid_id, count)
+                SELECT centroid_id, json_array_length(labels) FROM buckets
+            """)
+        cursor.execute("""
+            INSERT OR REPLACE INTO stats (name, value)
+            SELECT 'buckets', COUNT(*) FROM bucket_stats
+            UNION ALL SELECT 'postings', COALESCE(SUM(count), 0) FROM bucket_stats
+        """)
+
+    def _apply_stat_deltas(self, cursor):
+        """ Folds the per-bucket label count deltas staged in stat_delta into bucket_stats and stats. """
+        new_buckets = cursor.execute("""
+            SELECT COUNT(DISTINCT centroid_id) FROM stat_delta
+            WHERE centroid_id NOT IN (SELECT centroid_id FROM bucket_stats)
+        """).fetchone()[0]
+        new_postings = cursor.execute("SELECT COALESCE(SUM(delta), 0) FROM stat_delta").fetchone()[0]
+        cursor.execute("""
+            INSERT INTO bucket_stats (centroid_id, count)
+            SELECT centroid_id, SUM(delta) FROM stat_delta GROUP BY centroid_id
+            ON CONFLICT(centroid_id) DO UPDATE SET count = count + excluded.count
+        """)
+        cursor.executemany("""
+            INSERT INTO stats (name, value) VALUES (?, ?)
+            ON CONFLICT(name) DO UPDATE SET value = value + excluded.value
+        """, [("buckets", new_buckets), ("postings", new_postings)])
+        cursor.execute("DELETE FROM stat_delta")
+
+    def _create_job_tables(self, cursor):
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS ingest_jobs (
+                job_id TEXT PRIMARY KEY,
+                source TEXT NOT NULL,
+                num_rows INTEGER NOT NULL,
+                chunk_size INTEGER NOT NULL,
+                label_prefix TEXT NOT NULL,
+                status TEXT NOT NULL,
+                created REAL,
+                updated REAL
+            )
+        """)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS ingest_chunks (
+                job_id TEXT NOT NULL,
+                chunk_index INTEGER NOT NULL,
+                start INTEGER NOT NULL,
+                stop INTEGER NOT NULL,
+                committed REAL,
+                PRIMARY KEY (job_id, chunk_index)
+            ) WITHOUT ROWID
+        """)
+
+    def _get_meta(self, key):
+        row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, key, value):
+        self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, str(value)))
 
     def _centroid_to_key(self, centroid):
-        return ",".join(map(str, np.round(centroid).astype(int)))
+        if self.key_format == "text":
+            return ",".join(map(str, np.round(centroid).astype(int)))
+        return codec.pack_key(centroid)
+
+    def _centroids_to_keys(self, centroids):
+        """ Vectorized key encoding for a batch of centroids. """
+        if self.key_format == "text":
+            return [",".join(map(str, row)) for row in np.round(centroids).astype(int).tolist()]
+        return codec.pack_keys(centroids)
+
+    def _keys_to_centroids(self, keys):
+        """ Decodes stored bucket keys back into an (N, 24) integer array. """
+        if self.key_format == "text":
+            return np.array([[int(x) for x in k.split(",")] for k in keys])
+        return codec.unpack_keys(keys).astype(int)
 
     def index_batch(self, labels, vectors):
         print(f"Quantizing batch of {len(vectors)}...", flush=True)
@@ -36,15 +333,123 @@ class LeechDB:
             vectors = vectors.reshape(1, -1)
         centroids = self.leech.quantify_batch(vectors)
         
+        with self._write_lock:
+            self._append(self._centroids_to_keys(centroids), labels, self._encode_residuals(vectors, centroids))
+            self._commit()
+
+    def index_batch_precomputed(self, labels, centroids, commit=True, vectors=None):
+        """
+        Bulk ingest of centroids that were already quantized elsewhere (process
+        pool, thread pool, LeechGPU, ...). Keys are encoded for the whole batch at
+        once and written with a single executemany inside one transaction.
+        Pass commit=False to defer the commit (call commit() at the end of the run).
+        Pass the original `vectors` to store residuals when the DB keeps them.
+        """
+        centroids = np.asarray(centroids)
+        if centroids.ndim == 1:
+            centroids = centroids.reshape(1, -1)
+        if centroids.shape[1] != 24:
+            raise ValueError("Centroids must be 24-dimensional")
+        if len(labels) != len(centroids):
+            raise ValueError(f"Got {len(labels)} labels for {len(centroids)} centroids")
+
+        keys = self._centroids_to_keys(centroids)
+        residuals = None
+        if vectors is not None:
+            residuals = self._encode_residuals(np.asarray(vectors).reshape(len(centroids), -1), centroids)
+        with self._write_lock:
+            self._append(keys, labels, residuals)
+            if commit:
+                self._commit()
+
+    def commit(self):
+        """ Commits any deferred writes. """
+        with self._write_lock:
+            self._commit()
+
+    def _commit(self):
+        """ Commits the writer transaction, then invalidates cached results for the written buckets. """
+        self.conn.commit()
+        if self._dirty_keys:
+            keys, self._dirty_keys = self._dirty_keys, []
+            # Bump even when the cache is empty: a read in flight may be about to cache pre-commit results.
+            # A put that already passed its generation check is visible here and dropped below.
+            with self._cache_lock:
+                self._cache_generation += 1
+            if len(self.cache):
+                self._invalidate_cached(keys)
+
+    def _invalidate_cached(self, keys):
+        """ Drops cached exact results for `keys` and neighborhoods that contain any of them. """
+        unique = list(dict.fromkeys(keys))
+        self.cache.invalidate([("exact", key) for key in unique])
+
+        centers = [entry for entry in self.cache.keys() if entry[0] == "neighborhood"]
+        if not centers:
+            return
+        C = self._keys_to_centroids([entry[1] for entry in centers]).astype(np.int64)
+        c_norms = np.sum(C ** 2, axis=1)
+        affected = np.zeros(len(centers), dtype=bool)
+        for i in range(0, len(unique), 1024):
+            K = self._keys_to_centroids(unique[i:i + 1024]).astype(np.int64)
+            d2 = c_norms[None, :] + np.sum(K ** 2, axis=1)[:, None] - 2 * (K @ C.T)
+            affected |= np.any((d2 == 0) | (d2 == 32), axis=0)
+        self.cache.invalidate([centers[i] for i in np.nonzero(affected)[0]])
+
+    def _cached(self, cache_key, compute):
+        """ Returns the cached result for `cache_key`, computing and caching it on a miss. """
+        if self.cache.maxsize <= 0:
+            return compute()
+        hit = self.cache.get(cache_key)
+        if hit is not None:
+            return list(hit)
+        generation = self._cache_generation
+        result = compute()
+        # Skip the put if a commit landed while we were reading
+        with self._cache_lock:
+            if generation == self._cache_generation:
+                self.cache.put(cache_key, tuple(result))
+        return result
+
+    def _encode_residuals(self, vectors, centroids):
+        """ Residual codes (codes, scales) for the batch, or None if the DB keeps no residuals. """
+        if not self.residuals:
+            return None
+        return codec.encode_residuals(np.asarray(vectors, dtype=np.float64) - centroids, self.residuals)
+
+    @staticmethod
+    def _normalize_labels(labels):
+        """ Validates a batch of labels and converts them to the stored str form. """
+        labels = list(labels)
+        if any(label is None for label in labels):
+            raise ValueError("Labels must not be None")
+        return [label if isinstance(label, str) else str(label) for label in labels]
+
+    def _append(self, keys, labels, residuals=None):
+        """ Adds (key, label) pairs to the index inside the current transaction (caller holds the write lock). """
+        labels = self._normalize_labels(labels)
+        if len(labels) != len(keys):
+            raise ValueError(f"Got {len(labels)} labels for {len(keys)} keys")
+        if self._occupied is not None and len(keys):
+            self._occupied.add_points(self._keys_to_centroids(keys))
+        self._dirty_keys.extend(keys)
+        if self.storage == "postings":
+            if residuals is None:
+                rows = [(key, label, None, None) for key, label in zip(keys, labels)]
+            else:
+                rows = list(zip(keys, labels, residuals[0], residuals[1].tolist()))
+            self._append_postings(rows)
+            return
+
         # Optimize by grouping labels by bucket to minimize DB operations
         bucket_data = {}
-        for label, centroid in zip(labels, centroids):
-            key = self._centroid_to_key(centroid)
+        for label, key in zip(labels, keys):
             if key not in bucket_data:
                 bucket_data[key] = []
             bucket_data[key].append(label)
             
         cursor = self.conn.cursor()
+        deltas = []
         for key, new_labels in bucket_data.items():
             cursor.execute("SELECT labels FROM buckets WHERE centroid_id = ?", (key,))
             row = cursor.fetchone()
@@ -54,11 +459,53 @@ class LeechDB:
                 updated = list(set(existing + new_labels))
                 cursor.execute("UPDATE buckets SET labels = ? WHERE centroid_id = ?", 
                              (json.dumps(updated), key))
+                deltas.append((key, len(updated) - len(existing)))
             else:
                 cursor.execute("INSERT INTO buckets (centroid_id, labels) VALUES (?, ?)", 
                              (key, json.dumps(new_labels)))
-        
-        self.conn.commit()
+                deltas.append((key, len(new_labels)))
+        cursor.executemany("INSERT INTO stat_delta VALUES (?, ?)", deltas)
+        self._apply_stat_deltas(cursor)
+
+    def _append_postings(self, rows):
+        """
+        Append-only ingest for the postings format: stage (key, label, residual
+        code, scale) rows, add unseen labels to the dictionary and insert
+        postings (and residuals), all set-based in SQL.
+        """
+        cursor = self.conn.cursor()
+        cursor.execute("""
+            CREATE TEMP TABLE IF NOT EXISTS staging_postings (
+                centroid_id BLOB, label TEXT, code BLOB, scale REAL
+            )
+        """)
+        cursor.executemany("INSERT INTO staging_postings VALUES (?, ?, ?, ?)", rows)
+        cursor.execute("INSERT OR IGNORE INTO label_dict (label) SELECT label FROM staging_postings")
+        # Postings not stored yet, which are also the bucket count deltas
+        cursor.execute("""
+            INSERT INTO stat_delta (centroid_id, delta)
+            SELECT centroid_id, COUNT(*) FROM (
+                SELECT DISTINCT s.centroid_id, d.label_id
+                FROM staging_postings s JOIN label_dict d ON d.label = s.label
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM postings p WHERE p.centroid_id = s.centroid_id AND p.label_id = d.label_id
+                )
+            ) GROUP BY centroid_id
+        """)
+        cursor.execute("""
+            INSERT OR IGNORE INTO postings (centroid_id, label_id)
+            SELECT s.centroid_id, d.label_id
+            FROM staging_postings s JOIN label_dict d ON d.label = s.label
+        """)
+        self._apply_stat_deltas(cursor)
+        if self.residuals:
+            cursor.execute("""
+                INSERT OR REPLACE INTO residuals (label_id, centroid_id, code, scale)
+                SELECT d.label_id, s.centroid_id, s.code, s.scale
+                FROM staging_postings s JOIN label_dict d ON d.label = s.label
+                WHERE s.code IS NOT NULL
+            """)
+        cursor.execute("DELETE FROM staging_postings")
 
     def index_million_bulk(self, labels, vectors):
         """
@@ -67,78 +514,635 @@ class LeechDB:
         """
         print(f"Staging {len(vectors)} vectors for bulk commit...", flush=True)
         centroids = self.leech.quantify_batch(vectors)
+
+        with self._write_lock:
+            if self.storage == "postings":
+                print("Appending postings...", flush=True)
+                self._append(self._centroids_to_keys(centroids), labels, self._encode_residuals(vectors, centroids))
+                self._commit()
+                print("Bulk commit successful.", flush=True)
+                return
         
-        cursor = self.conn.cursor()
-        print("Creating staging table...", flush=True)
-        cursor.execute("CREATE TEMP TABLE staging (centroid_id TEXT, label TEXT)")
+            cursor = self.conn.cursor()
+            print("Creating staging table...", flush=True)
+            cursor.execute("CREATE TEMP TABLE staging (centroid_id BLOB, label TEXT)")
         
-        # 2. Fast bulk insert into staging
-        print("Bulk inserting into staging...", flush=True)
-        staging_data = [(self._centroid_to_key(c), l) for c, l in zip(centroids, labels)]
-        cursor.executemany("INSERT INTO staging VALUES (?, ?)", staging_data)
+            # 2. Fast bulk insert into staging
+            print("Bulk inserting into staging...", flush=True)
+            staging_data = list(zip(self._centroids_to_keys(centroids), self._normalize_labels(labels)))
+            cursor.executemany("INSERT INTO staging VALUES (?, ?)", staging_data)
+            self._dirty_keys.extend(key for key, _ in staging_data)
         
-        # 3. Merge staging into main buckets table using SQL group_by
-        print("Merging staging into production index...", flush=True)
-        cursor.execute("""
-            INSERT INTO buckets (centroid_id, labels)
-            SELECT centroid_id, json_group_array(label)
-            FROM staging
-            GROUP BY centroid_id
-            ON CONFLICT(centroid_id) DO UPDATE SET
-                labels = (
-                    SELECT json_group_array(value)
-                    FROM (
-                        SELECT value FROM json_each(buckets.labels)
-                        UNION
-                        SELECT label FROM staging WHERE staging.centroid_id = buckets.centroid_id
+            # Stats: subtract the current counts of the touched buckets, re-add them after the merge
+            cursor.execute("""
+                INSERT INTO stat_delta (centroid_id, delta)
+                SELECT b.centroid_id, -json_array_length(b.labels)
+                FROM buckets b WHERE b.centroid_id IN (SELECT centroid_id FROM staging)
+            """)
+
+            # 3. Merge staging into main buckets table using SQL group_by
+            print("Merging staging into production index...", flush=True)
+            cursor.execute("""
+                INSERT INTO buckets (centroid_id, labels)
+                SELECT centroid_id, json_group_array(label)
+                FROM staging
+                GROUP BY centroid_id
+                ON CONFLICT(centroid_id) DO UPDATE SET
+                    labels = (
+                        SELECT json_group_array(value)
+                        FROM (
+                            SELECT value FROM json_each(buckets.labels)
+                            UNION
+                            SELECT label FROM staging WHERE staging.centroid_id = buckets.centroid_id
+                        )
                     )
-                )
-        """)
-        cursor.execute("DROP TABLE staging")
-        self.conn.commit()
+            """)
+            cursor.execute("""
+                INSERT INTO stat_delta (centroid_id, delta)
+                SELECT b.centroid_id, json_array_length(b.labels)
+                FROM buckets b WHERE b.centroid_id IN (SELECT centroid_id FROM staging)
+            """)
+            self._apply_stat_deltas(cursor)
+            cursor.execute("DROP TABLE staging")
+            self._commit()
+            if self._occupied is not None:
+                self._occupied.add_points(centroids)
         print("Bulk commit successful.", flush=True)
 
-    def query_exact(self, vector):
+    def create_job(self, source, job_id=None, chunk_size=10000, label_prefix=""):
+        """
+        Records a checkpointed bulk-ingest job for a .npy source: the source
+        path, its row count and the chunk boundaries go into the ingest_jobs /
+        ingest_chunks manifest. Row i is labelled f"{label_prefix}{i}", so a
+        chunk can be re-ingested after a crash with identical results.
+        Creating a job that already exists with the same parameters is a
+        no-op. Returns the job id; run it with resume(job_id).
+        """
+        source = os.path.abspath(source)
+        num_rows = len(np.load(source, mmap_mode='r'))
+        job_id = job_id or os.path.basename(source)
+        with self._write_lock:
+            row = self.conn.execute("SELECT source, num_rows, chunk_size, label_prefix FROM ingest_jobs WHERE job_id = ?",
+                                    (job_id,)).fetchone()
+            if row is not None:
+                if tuple(row) != (source, num_rows, chunk_size, label_prefix):
+                    raise ValueError(f"Job '{job_id}' already exists with different parameters: {row}")
+                return job_id
+            now = time.time()
+            self.conn.execute("INSERT INTO ingest_jobs VALUES (?, ?, ?, ?, ?, 'pending', ?, ?)",
+                              (job_id, source, num_rows, chunk_size, label_prefix, now, now))
+            self.conn.executemany("INSERT INTO ingest_chunks VALUES (?, ?, ?, ?, NULL)",
+                                  [(job_id, i, start, min(start + chunk_size, num_rows))
+                                   for i, start in enumerate(range(0, num_rows, chunk_size))])
+            self.conn.commit()
+        return job_id
+
+    def job_status(self, job_id):
+        """ Manifest summary of a job: source, rows, chunk progress and status. """
+        with self._reader() as conn:
+            row = conn.execute("SELECT source, num_rows, chunk_size, status FROM ingest_jobs WHERE job_id = ?",
+                               (job_id,)).fetchone()
+            if row is None:
+                raise KeyError(f"Unknown ingest job '{job_id}'")
+            chunks, committed, committed_rows = conn.execute("""
+                SELECT COUNT(*), COUNT(committed), COALESCE(SUM(CASE WHEN committed IS NOT NULL THEN stop - start END), 0)
+                FROM ingest_chunks WHERE job_id = ?
+            """, (job_id,)).fetchone()
+        return {"job_id": job_id, "source": row[0], "num_rows": row[1], "chunk_size": row[2], "status": row[3],
+                "chunks": chunks, "committed_chunks": committed, "committed_rows": committed_rows}
+
+    def pending_chunks(self, job_id):
+        """ [(chunk_index, start, stop)] of the job's chunks that are not committed yet, in order. """
+        with self._reader() as conn:
+            return conn.execute("""
+                SELECT chunk_index, start, stop FROM ingest_chunks
+                WHERE job_id = ? AND committed IS NULL ORDER BY chunk_index
+            """, (job_id,)).fetchall()
+
+    def job_source(self, job_id):
+        """ (memmapped source array, label prefix) of a job. """
+        with self._reader() as conn:
+            row = conn.execute("SELECT source, label_prefix FROM ingest_jobs WHERE job_id = ?", (job_id,)).fetchone()
+        if row is None:
+            raise KeyError(f"Unknown ingest job '{job_id}'")
+        return np.load(row[0], mmap_mode='r'), row[1]
+
+    def commit_job_chunk(self, job_id, chunk_index, start, centroids, vectors=None, label_prefix=""):
+        """
+        Appends one job chunk (rows start .. start + len(centroids)) and marks
+        it committed in the same transaction, so a chunk is either fully
+        ingested and recorded or not at all. Re-running a chunk is harmless:
+        postings and bucket stats are idempotent.
+        """
+        labels = [f"{label_prefix}{i}" for i in range(start, start + len(centroids))]
+        keys = self._centroids_to_keys(centroids)
+        residuals = self._encode_residuals(vectors, centroids) if vectors is not None else None
+        with self._write_lock:
+            self._append(keys, labels, residuals)
+            now = time.time()
+            self.conn.execute("UPDATE ingest_chunks SET committed = ? WHERE job_id = ? AND chunk_index = ?",
+                              (now, job_id, chunk_index))
+            remaining = self.conn.execute(
+                "SELECT COUNT(*) FROM ingest_chunks WHERE job_id = ? AND committed IS NULL", (job_id,)).fetchone()[0]
+            self.conn.execute("UPDATE ingest_jobs SET status = ?, updated = ? WHERE job_id = ?",
+                              ("done" if remaining == 0 else "running", now, job_id))
+            self._commit()
+
+    def resume(self, job_id, max_memory_bytes=None):
+        """
+        Runs (or continues) a job created with create_job: every chunk not yet
+        committed is quantized and committed in order. Safe to call again after
+        a crash or on a finished job. Returns the number of chunks processed.
+        """
+        vectors, label_prefix = self.job_source(job_id)
+        pending = self.pending_chunks(job_id)
+        status = self.job_status(job_id)
+        print(f"Job '{job_id}': {status['committed_chunks']}/{status['chunks']} chunks committed, "
+              f"{len(pending)} to go", flush=True)
+        for chunk_index, start, stop in pending:
+            chunk = np.asarray(vectors[start:stop])
+            centroids = self.leech.quantify_batch(chunk, max_memory_bytes=max_memory_bytes)
+            self.commit_job_chunk(job_id, chunk_index, start, centroids, chunk, label_prefix)
+        return len(pending)
+
+    def ingest_stream(self, source, labels=None, chunk_size=10000, commit_every=100000,
+                      name=None, resume=True, max_memory_bytes=None):
+        """
+        Streams vectors into the index with bounded memory.
+
+        `source` is a path to a .npy file (opened with mmap_mode='r'), an array
+        or memmap, or an iterable of (labels, vectors) chunks. For array
+        sources, `labels` is a sequence sliced alongside the rows or a callable
+        labels(start, stop) -> list; by default the row index is the label.
+
+        A .npy path runs as a create_job job named `name` (default: the file
+        name, as in create_job), so its progress lives in the ingest_jobs /
+        ingest_chunks manifest like any other job: each chunk commits with its
+        manifest entry and resume=True continues with the uncommitted chunks.
+        Its labels are f"{labels}{i}" for a string prefix (default "").
+
+        Other sources are quantized chunk by chunk (scratch bounded by
+        max_memory_bytes), staged and appended; a commit happens every
+        `commit_every` rows. Their progress is recorded in `meta` under `name`
+        in the same transaction as the data, so with resume=True a crashed or
+        interrupted run continues after the last committed row.
+
+        Returns the number of rows ingested by this call.
+        """
+        if isinstance(source, (str, os.PathLike)):
+            return self._ingest_npy_job(source, labels, chunk_size, name, resume, max_memory_bytes)
+        progress_key = f"ingest_progress:{name}" if name else None
+        start = int(self._get_meta(progress_key) or 0) if (progress_key and resume) else 0
+        if start:
+            print(f"Resuming '{name}' after row {start}...", flush=True)
+
+        if isinstance(source, np.ndarray):
+            chunks = self._array_chunks(source, labels, start, chunk_size)
+        else:
+            chunks = self._skip_rows(source, start)
+
+        offset, ingested, uncommitted = start, 0, 0
+        try:
+            for chunk_labels, vectors in chunks:
+                vectors = np.asarray(vectors)
+                if vectors.ndim == 1:
+                    vectors = vectors.reshape(1, -1)
+                centroids = self.leech.quantify_batch(vectors, max_memory_bytes=max_memory_bytes)
+                residuals = self._encode_residuals(vectors, centroids)
+                with self._write_lock:
+                    self._append(self._centroids_to_keys(centroids), list(chunk_labels), residuals)
+                    offset += len(vectors)
+                    ingested += len(vectors)
+                    uncommitted += len(vectors)
+                    if uncommitted >= commit_every:
+                        self._commit_progress(progress_key, offset)
+                        uncommitted = 0
+                        print(f"Committed {offset} rows", flush=True)
+            with self._write_lock:
+                self._commit_progress(progress_key, offset)
+        except BaseException:
+            # Drop the rows since the last commit; a resumed run re-ingests them
+            with self._write_lock:
+                self._rollback()
+            raise
+        return ingested
+
+    def _ingest_npy_job(self, path, label_prefix, chunk_size, job_id, resume, max_memory_bytes):
+        """ ingest_stream for a .npy path: creates (or continues) the job and runs its pending chunks. """
+        if label_prefix is None:
+            label_prefix = ""
+        elif not isinstance(label_prefix, str):
+            raise ValueError("Labels of a .npy path source must be a string prefix; the job manifest "
+                             "cannot record a label sequence or callable (pass the loaded array instead)")
+        path = os.path.abspath(path)
+        job_id = job_id or os.path.basename(path)
+        with self._write_lock:
+            row = self.conn.execute("SELECT source, label_prefix FROM ingest_jobs WHERE job_id = ?",
+                                    (job_id,)).fetchone()
+            if row is not None and not resume:
+                # Start over; re-ingesting rows is harmless as postings are idempotent
+                self.conn.execute("DELETE FROM ingest_chunks WHERE job_id = ?", (job_id,))
+                self.conn.execute("DELETE FROM ingest_jobs WHERE job_id = ?", (job_id,))
+                self.conn.commit()
+                row = None
+        if row is None:
+            self.create_job(path, job_id=job_id, chunk_size=chunk_size, label_prefix=label_prefix)
+        elif tuple(row) != (path, label_prefix):
+            raise ValueError(f"Job '{job_id}' already exists with different parameters: {row}")
+
+        rows = sum(stop - start for _, start, stop in self.pending_chunks(job_id))
+        try:
+            self.resume(job_id, max_memory_bytes=max_memory_bytes)
+        except BaseException:
+            # Drop the chunk in flight; committed chunks stay recorded in the manifest
+            with self._write_lock:
+                self._rollback()
+            raise
+        return rows
+
+    def _rollback(self):
+        """ Rolls back the writer transaction and forgets the state it touched (caller holds the write lock). """
+        self.conn.rollback()
+        self._dirty_keys = []
+        # The occupied set may hold rolled-back points; reload it on the next query
+        self._occupied = None
+
+    def _commit_progress(self, progress_key, offset):
+        if progress_key:
+            self._set_meta(progress_key, offset)
+        self._commit()
+
+    @staticmethod
+    def _array_chunks(vectors, labels, start, chunk_size):
+        """ Yields (labels, vectors) slices of an array source from row `start`. """
+        for i in range(start, len(vectors), chunk_size):
+            stop = min(i + chunk_size, len(vectors))
+            if labels is None:
+                chunk_labels = [str(j) for j in range(i, stop)]
+            elif callable(labels):
+                chunk_labels = labels(i, stop)
+            else:
+                chunk_labels = labels[i:stop]
+            yield chunk_labels, vectors[i:stop]
+
+    @staticmethod
+    def _skip_rows(chunks, start):
+        """ Skips the first `start` rows of a (labels, vectors) chunk iterator. """
+        for chunk_labels, vectors in chunks:
+            if start >= len(vectors):
+                start -= len(vectors)
+                continue
+            if start:
+                chunk_labels, vectors = chunk_labels[start:], vectors[start:]
+                start = 0
+            yield chunk_labels, vectors
+
+    def _fetch_buckets(self, keys):
+        """
+        Returns {key: [labels]} for the occupied buckets among `keys`. Small key
+        sets use batched IN (...) lookups, large ones a single temp-table join.
+        """
+        keys = list(dict.fromkeys(keys))
+        if len(keys) > self._JOIN_THRESHOLD:
+            return self._fetch_buckets_joined(keys)
+        with self._reader() as conn:
+            cursor = conn.cursor()
+            found = {}
+            for i in range(0, len(keys), self._IN_BATCH):
+                batch = keys[i:i + self._IN_BATCH]
+                placeholders = ",".join("?" * len(batch))
+                if self.storage == "postings":
+                    cursor.execute(f"""
+                        SELECT p.centroid_id, d.label
+                        FROM postings p JOIN label_dict d ON d.label_id = p.label_id
+                        WHERE p.centroid_id IN ({placeholders})
+                        ORDER BY p.centroid_id, p.label_id
+                    """, batch)
+                    for key, label in cursor.fetchall():
+                        found.setdefault(key, []).append(label)
+                else:
+                    cursor.execute(f"SELECT centroid_id, labels FROM buckets WHERE centroid_id IN ({placeholders})", batch)
+                    for key, labels in cursor.fetchall():
+                        found[key] = json.loads(labels)
+            return found
+
+    def _fetch_buckets_joined(self, keys):
+        """ Stages `keys` in a temp table and fetches the occupied ones with one join. """
+        with self._reader() as conn:
+            cursor = conn.cursor()
+            cursor.execute("CREATE TEMP TABLE IF NOT EXISTS probe_keys (centroid_id BLOB PRIMARY KEY)")
+            cursor.executemany("INSERT OR IGNORE INTO probe_keys VALUES (?)", ((key,) for key in keys))
+            found = {}
+            if self.storage == "postings":
+                cursor.execute("""
+                    SELECT p.centroid_id, d.label
+                    FROM probe_keys k
+                    JOIN postings p ON p.centroid_id = k.centroid_id
+                    JOIN label_dict d ON d.label_id = p.label_id
+                    ORDER BY p.centroid_id, p.label_id
+                """)
+                for key, label in cursor.fetchall():
+                    found.setdefault(key, []).append(label)
+            else:
+                cursor.execute("""
+                    SELECT b.centroid_id, b.labels
+                    FROM probe_keys k JOIN buckets b ON b.centroid_id = k.centroid_id
+                """)
+                for key, labels in cursor.fetchall():
+                    found[key] = json.loads(labels)
+            cursor.execute("DELETE FROM probe_keys")
+            return found
+
+    def _all_keys(self, conn=None):
+        """ Returns every occupied bucket key (read through `conn` if given, else a pooled reader). """
+        if conn is None:
+            with self._reader() as conn:
+                return self._all_keys(conn)
+        if self.storage == "postings":
+            rows = conn.execute("SELECT DISTINCT centroid_id FROM postings").fetchall()
+        else:
+            rows = conn.execute("SELECT centroid_id FROM buckets").fetchall()
+        return [row[0] for row in rows]
+
+    def query_exact(self, vector, top_k=None):
         centroid = self.leech.quantify(vector)
         key = self._centroid_to_key(centroid)
-        cursor = self.conn.cursor()
-        cursor.execute("SELECT labels FROM buckets WHERE centroid_id = ?", (key,))
-        row = cursor.fetchone()
-        return json.loads(row[0]) if row else []
+        if top_k is not None:
+            return self._rerank(vector, self._fetch_buckets([key]), top_k)
+        return self._cached(("exact", key), lambda: self._fetch_buckets([key]).get(key, []))
+
+    def _rerank(self, vector, found, top_k):
+        """
+        Re-ranks the labels of the fetched buckets {key: [labels]} by distance
+        from `vector` to their reconstructed vectors (centroid + stored residual,
+        or just the bucket centroid when no residual is stored for that bucket)
+        and returns the nearest top_k labels, nearest first.
+        """
+        labels, keys, points = [], [], []
+        for key, bucket_labels in found.items():
+            labels.extend(bucket_labels)
+            keys.extend([key] * len(bucket_labels))
+            points.append(np.repeat(self._keys_to_centroids([key]).astype(np.float64), len(bucket_labels), axis=0))
+        if not labels:
+            return []
+        points = np.vstack(points)
 
-    def query_neighborhood(self, vector):
+        if self.residuals:
+            stored = self._fetch_residuals(labels)
+            for i, (label, key) in enumerate(zip(labels, keys)):
+                entry = stored.get(label)
+                if entry is not None and entry[0] == key:
+                    points[i] += codec.decode_residuals([entry[1]], [entry[2]], self.residuals)[0]
+
+        dists = np.sum((points - np.asarray(vector, dtype=np.float64).reshape(1, -1)) ** 2, axis=1)
+        # A label can sit in several buckets; keep its nearest occurrence
+        ranked = {}
+        for i in np.argsort(dists, kind="stable"):
+            ranked.setdefault(labels[i], None)
+            if len(ranked) == top_k:
+                break
+        return list(ranked)
+
+    def _fetch_residuals(self, labels):
+        """ Returns {label: (centroid key, code, scale)} for the labels that have a stored residual. """
+        unique = list(dict.fromkeys(labels))
+        residuals = {}
+        with self._reader() as conn:
+            cursor = conn.cursor()
+            for i in range(0, len(unique), self._IN_BATCH):
+                batch = unique[i:i + self._IN_BATCH]
+                placeholders = ",".join("?" * len(batch))
+                cursor.execute(f"""
+                    SELECT d.label, r.centroid_id, r.code, r.scale
+                    FROM label_dict d JOIN residuals r ON r.label_id = d.label_id
+                    WHERE d.label IN ({placeholders})
+                """, batch)
+                for label, key, code, scale in cursor.fetchall():
+                    residuals[label] = (key, code, scale)
+        return residuals
+
+    def query_multiprobe(self, vector, probes=4, top_k=None):
+        """
+        Multi-probe lookup: snaps the query to its `probes` nearest lattice candidates
+        and fetches those buckets in a single SELECT. Recovers neighbors that fall
+        just across a bucket boundary without scanning every bucket.
+        Labels are returned nearest probe first, or re-ranked when top_k is set.
+        """
+        points, _ = self.leech.quantify_topk(np.asarray(vector).reshape(1, -1), probes)
+        keys = self._centroids_to_keys(points[0])
+        found = self._fetch_buckets(keys)
+        if top_k is not None:
+            return self._rerank(vector, found, top_k)
+
+        results = []
+        for key in keys:
+            results.extend(found.get(key, []))
+        return list(dict.fromkeys(results))
+
+    def query_exact_batch(self, vectors):
+        """
+        Batch variant of query_exact: quantizes the whole query matrix at once,
+        deduplicates the keys and fetches all buckets in one set-based lookup.
+        Returns one label list per input row.
+        """
+        vectors = np.asarray(vectors)
+        if vectors.ndim == 1:
+            vectors = vectors.reshape(1, -1)
+        keys = self._centroids_to_keys(self.leech.quantify_batch(vectors))
+        found = self._fetch_buckets(keys)
+        return [list(found.get(key, [])) for key in keys]
+
+    def query_neighborhood(self, vector, strategy="memory", top_k=None):
         """ 
         Finds all labels in the nearest lattice point and all its neighbors.
-        Optimized by checking only buckets that exist in the database.
+
+        Candidate neighbors are generated directly as central point + neighbor
+        offset (see LeechLattice.get_neighbor_offsets), so the cost does not grow
+        with the number of buckets:
+          - "memory": the candidates' fingerprints (one vector add, the
+                      fingerprint is additive) are checked against an in-memory
+                      set of occupied buckets and only the hits are fetched.
+                      The set is loaded on first use and kept up to date by this
+                      instance's writes; call refresh_occupied() after writes
+                      made through other connections.
+          - "sql":    every candidate key is looked up with one temp-table join.
+
+        The result is an unordered label set; pass top_k to re-rank by distance
+        to the stored vectors and keep only the nearest top_k.
         """
+        self._check_strategy(strategy)
         central_q = self.leech.quantify(vector)
-        cursor = self.conn.cursor()
-        
-        # 1. Get all occupied bucket keys
-        cursor.execute("SELECT centroid_id FROM buckets")
-        keys = [row[0] for row in cursor.fetchall()]
-        if not keys:
-            return []
+        if top_k is not None:
+            keys = self._centroids_to_keys(self._neighbor_points(central_q, strategy))
+            return self._rerank(vector, self._fetch_buckets(keys), top_k)
 
-        # 2. Vectorized distance check
-        # We convert keys to arrays for math
-        key_arrays = np.array([[int(x) for x in k.split(",")] for k in keys])
-        diffs = key_arrays - central_q
-        dists_sq = np.sum(diffs**2, axis=1)
-        
-        # Leech neighbors are distance sqrt(32) away. 
+        def compute():
+            keys = self._centroids_to_keys(self._neighbor_points(central_q, strategy))
+            results = []
+            for labels in self._fetch_buckets(keys).values():
+                results.extend(labels)
+            return list(set(results))
+        return self._cached(("neighborhood", self._centroid_to_key(central_q)), compute)
+
+    def query_neighborhood_batch(self, vectors, strategy="memory"):
+        """
+        Batch variant of query_neighborhood: one quantify_batch over all queries,
+        candidate generation per query, then a single fetch of the deduplicated
+        union of occupied keys. Returns one label list per input row.
+        """
+        self._check_strategy(strategy)
+        vectors = np.asarray(vectors)
+        if vectors.ndim == 1:
+            vectors = vectors.reshape(1, -1)
+        centrals = self.leech.quantify_batch(vectors)
+
+        per_query = [self._centroids_to_keys(self._neighbor_points(c, strategy)) for c in centrals]
+        found = self._fetch_buckets([key for keys in per_query for key in keys])
+
+        batch_results = []
+        for keys in per_query:
+            results = []
+            for key in keys:
+                results.extend(found.get(key, []))
+            batch_results.append(list(set(results)))
+        return batch_results
+
+    def _check_strategy(self, strategy):
+        if strategy not in self.NEIGHBORHOOD_STRATEGIES:
+            raise ValueError(f"Unknown strategy '{strategy}'. Use one of {self.NEIGHBORHOOD_STRATEGIES}.")
+
+    def _neighbor_points(self, central_q, strategy):
+        """ Central point followed by its (occupied, for "memory") neighbor points. """
+        central_q = np.round(central_q).astype(np.int64)
+        offsets = self.leech.get_neighbor_offsets()
+        if strategy == "sql":
+            return np.vstack((central_q, central_q + offsets))
+
+        # Leech neighbors are distance sqrt(32) away.
         # We include dist 0 (exact match) and dist 32 (neighbors).
-        matches = np.where((dists_sq < 0.1) | (np.abs(dists_sq - 32.0) < 0.1))[0]
-        
-        results = []
-        for idx in matches:
-            cursor.execute("SELECT labels FROM buckets WHERE centroid_id = ?", (keys[idx],))
-            results.extend(json.loads(cursor.fetchone()[0]))
-            
-        return list(set(results))
+        with np.errstate(over='ignore'):
+            candidate_fps = codec.fingerprint64(central_q)[0] + self._neighbor_fingerprints()
+        hits = np.nonzero(self._occupied_set().contains(candidate_fps))[0]
+        return np.vstack((central_q, central_q + offsets[hits]))
+
+    def refresh_occupied(self):
+        """ Drops the in-memory occupied-bucket set; it is reloaded on the next query. """
+        with self._write_lock:
+            self._occupied = None
+
+    def _occupied_set(self):
+        if self._occupied is None:
+            # Load through the writer so rows appended but not yet committed are included
+            with self._write_lock:
+                if self._occupied is None:
+                    keys = self._all_keys(self.conn)
+                    self._occupied = FingerprintSet.from_points(
+                        self._keys_to_centroids(keys) if keys else np.empty((0, 24)))
+        return self._occupied
+
+    def _neighbor_fingerprints(self):
+        if self._neighbor_fps is None:
+            self._neighbor_fps = codec.fingerprint64(self.leech.get_neighbor_offsets())
+        return self._neighbor_fps
+
+    def bucket_stats(self):
+        """
+        Occupancy summary from the maintained counters: number of buckets,
+        number of (bucket, label) postings, mean and max bucket size.
+        """
+        with self._reader() as conn:
+            counters = dict(conn.execute("SELECT name, value FROM stats").fetchall())
+            max_size = conn.execute("SELECT MAX(count) FROM bucket_stats").fetchone()[0] or 0
+        num_buckets = counters.get("buckets", 0)
+        num_postings = counters.get("postings", 0)
+        return {
+            "buckets": num_buckets,
+            "postings": num_postings,
+            "mean_bucket_size": num_postings / num_buckets if num_buckets else 0.0,
+            "max_bucket_size": max_size,
+        }
+
+    def largest_buckets(self, n=10):
+        """ The n most populated buckets as [(centroid (24,) int array, count)], largest first. """
+        with self._reader() as conn:
+            rows = conn.execute(
+                "SELECT centroid_id, count FROM bucket_stats ORDER BY count DESC LIMIT ?", (n,)).fetchall()
+        if not rows:
+            return []
+        centroids = self._keys_to_centroids([row[0] for row in rows])
+        return [(centroid, count) for centroid, (_, count) in zip(centroids, rows)]
+
+    def bucket_histogram(self):
+        """ Bucket size histogram {bucket size: number of buckets}, read from the count index. """
+        with self._reader() as conn:
+            rows = conn.execute("SELECT count, COUNT(*) FROM bucket_stats GROUP BY count").fetchall()
+        return dict(rows)
+
+    def bucket_counts(self):
+        """ Every occupied bucket with its size: (centroids (N, 24) int array, counts (N,) array). """
+        with self._reader() as conn:
+            rows = conn.execute("SELECT centroid_id, count FROM bucket_stats").fetchall()
+        if not rows:
+            return np.empty((0, 24), dtype=int), np.empty(0, dtype=int)
+        return self._keys_to_centroids([row[0] for row in rows]), np.array([row[1] for row in rows])
+
+    def migrate_to_postings(self, convert_keys=True):
+        """
+        Converts a legacy JSON-bucket database to the postings format in place.
+        Labels move into label_dict/postings with set-based SQL and the buckets
+        table is dropped. With convert_keys=True, legacy comma-joined TEXT keys
+        are re-encoded as packed binary keys on the way.
+        """
+        with self._write_lock:
+            if self.storage == "postings":
+                return
+            cursor = self.conn.cursor()
+            self._create_postings_tables(cursor)
+
+            # Old key -> new key mapping (identity unless text keys are converted)
+            cursor.execute("CREATE TEMP TABLE key_map (old_key PRIMARY KEY, new_key BLOB)")
+            old_keys = [row[0] for row in cursor.execute("SELECT centroid_id FROM buckets").fetchall()]
+            if convert_keys and self.key_format == "text":
+                new_keys = codec.pack_keys(self._keys_to_centroids(old_keys)) if old_keys else []
+            else:
+                new_keys = old_keys
+            cursor.executemany("INSERT INTO key_map VALUES (?, ?)", zip(old_keys, new_keys))
+
+            cursor.execute("""
+                INSERT OR IGNORE INTO label_dict (label)
+                SELECT j.value FROM buckets b, json_each(b.labels) j
+            """)
+            cursor.execute("""
+                INSERT OR IGNORE INTO postings (centroid_id, label_id)
+                SELECT m.new_key, d.label_id
+                FROM buckets b
+                JOIN key_map m ON m.old_key = b.centroid_id, json_each(b.labels) j
+                JOIN label_dict d ON d.label = j.value
+            """)
+            cursor.execute("DROP TABLE key_map")
+            cursor.execute("DROP TABLE buckets")
+
+            self.storage = "postings"
+            self._set_meta("storage", self.storage)
+            if convert_keys:
+                self.key_format = "binary"
+                self._set_meta("key_format", self.key_format)
+            self._rebuild_bucket_stats(cursor)
+            self.conn.commit()
+            self._occupied = None
+            with self._cache_lock:
+                self._cache_generation += 1
+            self.cache.clear()
 
     def close(self):
-        self.conn.close()
+        with self._write_lock:
+            # Idle pooled readers; connections checked out right now are closed when garbage collected
+            while True:
+                try:
+                    self._pool.get_nowait().close()
+                except queue.Empty:
+                    break
+            self.conn.close()
 
 if __name__ == "__main__":
     db = LeechDB("test_scale.db")
@@ -1,5 +1,9 @@
+import shutil
 import numpy as np
 from core.lattices import LeechLattice
+from core import codec
+from core.keyset import FingerprintSet
+from leech_snapshot import LeechSnapshot
 import time
 
 class LeechHash:
@@ -7,63 +11,239 @@ class LeechHash:
     Experimental Lattice-Based Hashing.
     Uses the Leech Lattice to provide locality-sensitive hashing (LSH)
     where similar vectors naturally collide into the same lattice point.
+
+    Besides the key -> labels table, the occupied lattice points are kept in an
+    int16 array that grows geometrically (amortized O(1) per new bucket) and in
+    a fingerprint set, so neighborhood lookups never rebuild anything from the
+    dict.
+
+    save(path) writes the table in the compact LeechSnapshot array format
+    (sorted key fingerprints, int16 keys, CSR offsets, int32 label ids and a
+    label string table; labels are stored as strings). load(path, mmap=True)
+    serves lookups straight from the memory-mapped arrays: no per-entry Python
+    objects, instant start-up, and one page-cached copy shared by every
+    process. Such an instance is read-only; load(path, mmap=False) rebuilds a
+    mutable in-memory table instead.
+
+    `decoder` selects the LeechLattice decoder ("coset" default, "golay" for
+    the fast ML decoder); a loaded table uses the decoder it was saved with.
     """
-    def __init__(self):
-        self.leech = LeechLattice()
+    _INITIAL_CAPACITY = 1024
+    # Up to this many buckets a direct distance scan beats probing ~196k neighbor fingerprints
+    _SCAN_MAX_POINTS = 50000
+
+    def __init__(self, decoder="coset"):
+        self.leech = LeechLattice(decoder=decoder)
         self.table = {}
+        self._points = np.empty((self._INITIAL_CAPACITY, codec.DIM), dtype=codec.KEY_DTYPE)
+        self._num_points = 0
+        self._occupied = FingerprintSet()
+        self._neighbor_fps = None
+        self._snapshot = None  # set by load(mmap=True)
+
+    @property
+    def occupied_points(self):
+        """ (num_buckets, 24) int16 view of the occupied lattice points, in insertion order. """
+        if self._snapshot is not None:
+            return self._snapshot.keys
+        return self._points[:self._num_points]
+
+    def save(self, path):
+        """ Writes the table to `path` in the compact snapshot format. """
+        if self._snapshot is not None:
+            shutil.copyfile(self._snapshot.path, path)
+            return
+        label_ids = {}
+        buckets = []
+        for key in codec.pack_keys(self.occupied_points):
+            buckets.append([label_ids.setdefault(str(label), len(label_ids)) for label in self.table[key]])
+        LeechSnapshot.write(path, self.occupied_points, buckets, list(label_ids), decoder=self.leech.decoder)
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """
+        Loads a table written by save(). With mmap=True lookups run directly on
+        the memory-mapped file (read-only); with mmap=False the dict table is
+        rebuilt in memory and can be extended.
+        """
+        snapshot = LeechSnapshot(path)
+        lh = cls(decoder=snapshot.leech.decoder)
+        if mmap:
+            lh._snapshot = snapshot
+            return lh
+
+        labels = [snapshot.label(i) for i in range(len(snapshot.label_offsets) - 1)]
+        label_ids = np.asarray(snapshot.label_ids)
+        offsets = np.asarray(snapshot.offsets)
+        points = np.array(snapshot.keys)
+        for b, key in enumerate(codec.pack_keys(points)):
+            lh.table[key] = [labels[i] for i in label_ids[offsets[b]:offsets[b + 1]]]
+        lh._add_points(points)
+        return lh
 
     def index(self, label, vector):
-        q = self.leech.quantify(vector)
-        # Standardize key as integer tuple to avoid float precision issues in dict keys
-        h = tuple(np.round(q).astype(int).tolist())
-        if h not in self.table:
-            self.table[h] = []
-        self.table[h].append(label)
+        self.index_many([label], np.asarray(vector).reshape(1, -1))
+
+    def index_many(self, labels, X):
+        """ Indexes a batch: one quantify_batch call and one vectorized key packing for all rows. """
+        if self._snapshot is not None:
+            raise ValueError("A LeechHash loaded with mmap=True is read-only; use load(path, mmap=False) to modify it")
+        X = np.asarray(X)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        if len(labels) != len(X):
+            raise ValueError(f"Got {len(labels)} labels for {len(X)} vectors")
+        coords = codec.to_coords(self.leech.quantify_batch(X))
+        # Packed integer key avoids float precision issues in dict keys
+        new_rows = []
+        for i, (h, label) in enumerate(zip(codec.pack_keys(coords), labels)):
+            bucket = self.table.get(h)
+            if bucket is None:
+                self.table[h] = bucket = []
+                new_rows.append(i)
+            bucket.append(label)
+        if new_rows:
+            self._add_points(coords[new_rows])
+
+    def _add_points(self, points):
+        needed = self._num_points + len(points)
+        if needed > len(self._points):
+            capacity = len(self._points)
+            while capacity < needed:
+                capacity *= 2
+            grown = np.empty((capacity, codec.DIM), dtype=codec.KEY_DTYPE)
+            grown[:self._num_points] = self._points[:self._num_points]
+            self._points = grown
+        self._points[self._num_points:needed] = points
+        self._num_points = needed
+        self._occupied.add_points(points)
 
     def lookup(self, vector):
         """ Returns labels from the exact matching lattice point. """
+        if self._snapshot is not None:
+            return self._snapshot.query_exact(vector)
         q = self.leech.quantify(vector)
-        h = tuple(np.round(q).astype(int).tolist())
-        return self.table.get(h, [])
+        return self.table.get(codec.pack_key(q), [])
+
+    def lookup_multiprobe(self, vector, probes=4):
+        """
+        Returns labels from the `probes` nearest lattice candidates of the query,
+        nearest first. Cheaper than a neighborhood sweep and catches near-collisions
+        that land just across a Voronoi boundary.
+        """
+        if self._snapshot is not None:
+            return self._snapshot.query_multiprobe(vector, probes)
+        points, _ = self.leech.quantify_topk(np.asarray(vector).reshape(1, -1), probes)
+        results = []
+        for key in codec.pack_keys(points[0]):
+            results.extend(self.table.get(key, []))
+        return list(dict.fromkeys(results))
 
     def lookup_neighborhood(self, vector):
         """ 
         Returns labels from the nearest lattice point AND its closest neighbors.
-        Optimized to only check occupied buckets.
+        Optimized to only check occupied buckets: small tables compare the
+        query against the occupied-point array, large ones probe the neighbor
+        fingerprints (central + offset) against the occupied set.
         """
-        central_q = self.leech.quantify(vector)
-        results = []
-        
-        # 1. Get labels from the exact centroid
-        central_tuple = tuple(np.round(central_q).astype(int).tolist())
-        results.extend(self.table.get(central_tuple, []))
-        
-        # 2. Get minimal vectors (neighbors)
-        min_vecs = self.leech.get_minimal_vectors()
-        
-        # 3. Optimization for Scaling: 
-        # Instead of iterating 196k vectors, we check if table size warrants
-        # a different approach. For now, we iterate, but we could use a 
-        # KD-Tree on the table keys if the table grew to millions of buckets.
-        
-        # Pre-convert table keys to an array for vectorized math
+        if self._snapshot is not None:
+            return self._snapshot.query_neighborhood(vector)
+        central_q = np.round(self.leech.quantify(vector)).astype(np.int64)
         if not self.table:
             return []
-            
-        table_keys = np.array(list(self.table.keys()))
-        
-        # Find keys that are exactly distance sqrt(32) away
-        # d^2 = 32
-        diffs = table_keys - central_q
-        dists_sq = np.sum(diffs**2, axis=1)
-        
-        neighbor_keys = table_keys[np.isclose(dists_sq, 32.0)]
-        
-        for nk in neighbor_keys:
-            results.extend(self.table.get(tuple(nk.tolist()), []))
+
+        offsets = self.leech.get_neighbor_offsets()
+        if self._num_points <= self._SCAN_MAX_POINTS:
+            # Find keys that are exactly distance sqrt(32) away
+            dists_sq = np.sum((self.occupied_points - central_q) ** 2, axis=1)
+            neighbor_points = self.occupied_points[dists_sq == 32]
+        else:
+            if self._neighbor_fps is None:
+                self._neighbor_fps = codec.fingerprint64(offsets)
+            with np.errstate(over='ignore'):
+                candidate_fps = codec.fingerprint64(central_q)[0] + self._neighbor_fps
+            neighbor_points = central_q + offsets[self._occupied.contains(candidate_fps)]
+
+        results = list(self.table.get(codec.pack_key(central_q), []))
+        for nk in codec.pack_keys(neighbor_points):
+            results.extend(self.table.get(nk, []))
             
         return list(set(results))
 
+class MultiLeechHash:
+    """
+    Multi-table randomized Leech LSH.
+
+    A single lattice never collides two close vectors that sit on opposite
+    sides of a Voronoi boundary. MultiLeechHash keeps `num_tables` independent
+    LeechHash tables; table t maps x to (x @ R_t^T) * scale + s_t with a seeded
+    random rotation R_t and a random shift s_t, so the boundaries fall in
+    different places in every table. Queries run one batched quantization per
+    table and union the candidates.
+
+    Recall/latency knobs: more tables raise recall (and memory and query cost
+    linearly); a larger `scale` shrinks the cells (fewer, closer candidates).
+    """
+    def __init__(self, num_tables=4, scale=1.0, seed=0, decoder="coset"):
+        self.num_tables = num_tables
+        self.scale = scale
+        rng = np.random.default_rng(seed)
+        self.tables = [LeechHash(decoder=decoder) for _ in range(num_tables)]
+        self.rotations = []
+        self.shifts = []
+        for _ in range(num_tables):
+            # Haar-random orthogonal matrix: QR of a Gaussian with the signs of R's diagonal fixed
+            q, r = np.linalg.qr(rng.standard_normal((codec.DIM, codec.DIM)))
+            self.rotations.append(q * np.sign(np.diag(r)))
+            # Shift uniformly within the 4Z^24 period of the lattice
+            self.shifts.append(rng.uniform(0.0, 4.0, codec.DIM))
+
+    def _transform(self, t, X):
+        return (X @ self.rotations[t].T) * self.scale + self.shifts[t]
+
+    def index(self, label, vector):
+        self.index_many([label], np.asarray(vector).reshape(1, -1))
+
+    def index_many(self, labels, X):
+        """ Indexes a batch into every table (one quantify_batch per table). """
+        X = np.asarray(X, dtype=np.float64)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        for t, table in enumerate(self.tables):
+            table.index_many(labels, self._transform(t, X))
+
+    def lookup(self, vector):
+        """ Union of the query's buckets over all tables, labels colliding in more tables first. """
+        return self.lookup_batch(np.asarray(vector).reshape(1, -1))[0]
+
+    def lookup_batch(self, X, return_sizes=False):
+        """
+        Candidate labels for each query row, ordered by the number of tables
+        they collide in (then by table order). With return_sizes=True also
+        returns an (N, num_tables + 1) array: each table's bucket size and the
+        size of the union.
+        """
+        X = np.asarray(X, dtype=np.float64)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        votes = [{} for _ in range(len(X))]
+        sizes = np.zeros((len(X), self.num_tables + 1), dtype=np.int64)
+        for t, table in enumerate(self.tables):
+            coords = codec.to_coords(table.leech.quantify_batch(self._transform(t, X)))
+            for i, key in enumerate(codec.pack_keys(coords)):
+                bucket = table.table.get(key, [])
+                sizes[i, t] = len(bucket)
+                for label in bucket:
+                    votes[i][label] = votes[i].get(label, 0) + 1
+
+        results = []
+        for i, counts in enumerate(votes):
+            sizes[i, -1] = len(counts)
+            results.append(sorted(counts, key=counts.get, reverse=True))
+        if return_sizes:
+            return results, sizes
+        return results
+
 if __name__ == "__main__":
     lh = LeechHash()
     print("--- Leech-LSH: Neighborhood Search Prototype ---")
@@ -86,7 +266,7 @@ if __name__ == "__main__":
     # Querying
     # Get the actual centroid of AI_Core to create a neighbor query
     first_key = list(lh.table.keys())[0]
-    target_centroid = np.array(first_key)
+    target_centroid = codec.unpack_keys(first_key)[0].astype(int)
     min_vecs = lh.leech.get_minimal_vectors()
     
     # We need to find a neighbor that is EXACTLY one minimal vector away
@@ -106,7 +286,7 @@ if __name__ == "__main__":
     print(f"Norm squared of difference: {norm_sq}")
     
     # Manual check of neighborhood logic
-    print(f"Checking if target {first_key[:3]} is in neighborhood of {tuple(neighbor_centroid[:3].astype(int).tolist())}...")
+    print(f"Checking if target {tuple(target_centroid[:3].tolist())} is in neighborhood of {tuple(neighbor_centroid[:3].astype(int).tolist())}...")
     
     # Simple check:
     found = False
@@ -0,0 +1,209 @@
+import os
+import json
+import struct
+import numpy as np
+from core.lattices import LeechLattice
+from core import codec
+
+class LeechSnapshot:
+    """
+    Immutable, memory-mapped export of a LeechDB for read-heavy serving.
+
+    File layout (little-endian): an 8-byte magic, a uint32 format version and
+    a uint32 header length, a JSON header describing the arrays, then each
+    array 64-byte aligned:
+      - fingerprints (B,)   int64   codec.fingerprint64 of each bucket, sorted
+      - keys         (B, 24) int16  bucket centroids in fingerprint order
+      - offsets      (B+1,) int64   CSR offsets of each bucket into label_ids
+      - label_ids    (P,)   int32   postings, grouped by bucket
+      - label_offsets(L+1,) int64   offsets of each label into label_bytes
+      - label_bytes  (S,)   uint8   UTF-8 label string table
+
+    Lookups are a searchsorted over the fingerprints, confirmed against the
+    stored keys, with no SQL and no JSON parsing. Every array is an np.memmap,
+    so any number of worker processes share one page-cached copy and opening a
+    snapshot costs only the header read.
+    """
+    MAGIC = b"LEECHSNP"
+    VERSION = 1
+    _ALIGN = 64
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            magic, version, header_len = struct.unpack("<8sII", f.read(16))
+            if magic != self.MAGIC:
+                raise ValueError(f"{path} is not a LeechDB snapshot")
+            if version != self.VERSION:
+                raise ValueError(f"Unsupported snapshot version {version} (expected {self.VERSION})")
+            self.header = json.loads(f.read(header_len))
+
+        self.leech = LeechLattice(decoder=self.header["decoder"])
+        arrays = {}
+        for name, (dtype, shape, offset) in self.header["arrays"].items():
+            if int(np.prod(shape)) == 0:
+                arrays[name] = np.zeros(shape, dtype=dtype)
+            else:
+                arrays[name] = np.memmap(path, dtype=dtype, mode="r", offset=offset, shape=tuple(shape))
+        self.fingerprints = arrays["fingerprints"]
+        self.keys = arrays["keys"]
+        self.offsets = arrays["offsets"]
+        self.label_ids = arrays["label_ids"]
+        self.label_offsets = arrays["label_offsets"]
+        self.label_bytes = arrays["label_bytes"]
+
+    def __len__(self):
+        """ Number of occupied buckets. """
+        return len(self.fingerprints)
+
+    @classmethod
+    def write(cls, path, centroids, bucket_label_ids, labels, decoder="coset"):
+        """
+        Writes a snapshot. `centroids` is (B, 24), `bucket_label_ids` a list of
+        B integer sequences indexing into the `labels` list.
+        """
+        coords = codec.to_coords(centroids) if len(centroids) else np.empty((0, codec.DIM), dtype=codec.KEY_DTYPE)
+        fps = codec.fingerprint64(coords) if len(coords) else np.empty(0, dtype=np.int64)
+        order = np.argsort(fps, kind="stable")
+
+        counts = np.array([len(bucket_label_ids[i]) for i in order], dtype=np.int64)
+        offsets = np.concatenate(([0], np.cumsum(counts))).astype(np.int64)
+        label_ids = np.fromiter((lid for i in order for lid in bucket_label_ids[i]), dtype=np.int32, count=int(offsets[-1]))
+
+        encoded = [label.encode("utf-8") for label in labels]
+        label_offsets = np.concatenate(([0], np.cumsum([len(b) for b in encoded]))).astype(np.int64)
+        label_bytes = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+
+        arrays = {
+            "fingerprints": fps[order],
+            "keys": coords[order],
+            "offsets": offsets,
+            "label_ids": label_ids,
+            "label_offsets": label_offsets,
+            "label_bytes": label_bytes,
+        }
+
+        # Lay out the arrays after a header whose size does not depend on the offsets it records
+        layout, cursor = {}, 0
+        for name, arr in arrays.items():
+            cursor = -(-cursor // cls._ALIGN) * cls._ALIGN
+            layout[name] = [arr.dtype.str, list(arr.shape), cursor]
+            cursor += arr.nbytes
+        header_len = 4096
+        while True:
+            base = -(-(16 + header_len) // cls._ALIGN) * cls._ALIGN
+            header = {"decoder": decoder, "arrays": {n: [d, s, o + base] for n, (d, s, o) in layout.items()}}
+            header_bytes = json.dumps(header).encode("utf-8")
+            if len(header_bytes) <= header_len:
+                break
+            header_len *= 2
+        header_bytes = header_bytes.ljust(header_len)
+
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(struct.pack("<8sII", cls.MAGIC, cls.VERSION, header_len))
+            f.write(header_bytes)
+            for name, arr in arrays.items():
+                f.seek(header["arrays"][name][2])
+                f.write(np.ascontiguousarray(arr).tobytes())
+        os.replace(tmp_path, path)
+
+    def label(self, label_id):
+        start, stop = self.label_offsets[label_id], self.label_offsets[label_id + 1]
+        return self.label_bytes[start:stop].tobytes().decode("utf-8")
+
+    def find_buckets(self, points):
+        """ Returns the bucket index of each point, or -1 where the point is not occupied. """
+        points = codec.to_coords(points)
+        fps = codec.fingerprint64(points)
+        return self._find(fps, points)
+
+    def _find(self, fps, points=None):
+        if not len(self.fingerprints):
+            return np.full(len(fps), -1, dtype=np.intp)
+        idx = np.searchsorted(self.fingerprints, fps)
+        np.minimum(idx, len(self.fingerprints) - 1, out=idx)
+        hit = self.fingerprints[idx] == fps
+        if points is not None:
+            hit &= np.all(self.keys[idx] == points, axis=1)
+        return np.where(hit, idx, -1)
+
+    def bucket_labels(self, bucket):
+        """ Labels stored in bucket index `bucket`. """
+        if bucket < 0:
+            return []
+        ids = self.label_ids[self.offsets[bucket]:self.offsets[bucket + 1]]
+        return [self.label(i) for i in ids]
+
+    def query_exact(self, vector):
+        return self.query_exact_batch(np.asarray(vector).reshape(1, -1))[0]
+
+    def query_exact_batch(self, vectors):
+        """ One label list per query row. """
+        vectors = np.asarray(vectors)
+        if vectors.ndim == 1:
+            vectors = vectors.reshape(1, -1)
+        buckets = self.find_buckets(self.leech.quantify_batch(vectors))
+        return [self.bucket_labels(b) for b in buckets]
+
+    def query_multiprobe(self, vector, probes=4):
+        """ Labels of the `probes` nearest lattice points, nearest probe first. """
+        points, _ = self.leech.quantify_topk(np.asarray(vector).reshape(1, -1), probes)
+        results = []
+        for b in self.find_buckets(points[0]):
+            results.extend(self.bucket_labels(b))
+        return list(dict.fromkeys(results))
+
+    def query_neighborhood(self, vector):
+        """ Labels in the nearest lattice point and all its neighbors (see LeechDB.query_neighborhood). """
+        central_q = np.round(self.leech.quantify(vector)).astype(np.int64)
+        offsets = self.leech.get_neighbor_offsets()
+        if not hasattr(self, "_neighbor_fps"):
+            self._neighbor_fps = codec.fingerprint64(offsets)
+        with np.errstate(over='ignore'):
+            candidate_fps = codec.fingerprint64(central_q)[0] + self._neighbor_fps
+        hits = np.nonzero(self._find(candidate_fps) >= 0)[0]
+
+        points = np.vstack((central_q, central_q + offsets[hits]))
+        results = []
+        for b in self.find_buckets(points):
+            results.extend(self.bucket_labels(b))
+        return list(set(results))
+
+def export_snapshot(db, path):
+    """ Exports a LeechDB (either storage format) into a snapshot file at `path`. """
+    with db._reader() as conn:
+        if db.storage == "postings":
+            rows = conn.execute("SELECT label_id, label FROM label_dict ORDER BY label_id").fetchall()
+            dense = {label_id: i for i, (label_id, _) in enumerate(rows)}
+            labels = [label for _, label in rows]
+            keys, buckets = [], []
+            for key, label_id in conn.execute("SELECT centroid_id, label_id FROM postings ORDER BY centroid_id, label_id"):
+                if not keys or keys[-1] != key:
+                    keys.append(key)
+                    buckets.append([])
+                buckets[-1].append(dense[label_id])
+        else:
+            dense, labels, keys, buckets = {}, [], [], []
+            for key, bucket_json in conn.execute("SELECT centroid_id, labels FROM buckets"):
+                ids = []
+                for label in json.loads(bucket_json):
+                    if label not in dense:
+                        dense[label] = len(labels)
+                        labels.append(label)
+                    ids.append(dense[label])
+                keys.append(key)
+                buckets.append(ids)
+
+    centroids = db._keys_to_centroids(keys) if keys else np.empty((0, codec.DIM))
+    LeechSnapshot.write(path, centroids, buckets, labels, decoder=db.leech.decoder)
+    return LeechSnapshot(path)
+
+if __name__ == "__main__":
+    from leech_db import LeechDB
+    db = LeechDB("test_scale.db")
+    data = np.random.randn(1000, 24) * 5.0
+    db.index_batch([f"item_{i}" for i in range(1000)], data)
+    snapshot = export_snapshot(db, "test_scale.snapshot")
+    print(f"Snapshot: {len(snapshot)} buckets, query for item_0: {snapshot.query_exact(data[0])}")
+    db.close()
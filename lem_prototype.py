@@ -19,13 +19,9 @@ class LatticeEmbeddingMapper:
         Maps a batch of embeddings to the nearest lattice points.
         embeddings: ndarray of shape (N, dim)
         """
-        mapped = []
-        for vec in embeddings:
-            # Scale or normalize if needed to fit the lattice density
-            # For now, we assume the input is already appropriately scaled
-            q = self.lattice.quantify(vec)
-            mapped.append(q)
-        return np.array(mapped)
+        # Scale or normalize if needed to fit the lattice density
+        # For now, we assume the input is already appropriately scaled
+        return self.lattice.quantify_batch(np.asarray(embeddings))
 
     def calculate_distortion(self, original, mapped):
         """ Calculates the Mean Squared Error between original and mapped points. """
@@ -1,61 +1,317 @@
 import numpy as np
 import time
+import queue
+import threading
 import multiprocessing as mp
+from functools import partial
+from contextlib import contextmanager
+from multiprocessing import shared_memory
 from core.lattices import LeechLattice
 from leech_db import LeechDB
+from core import codec, tables
 import os
 
-def _worker_quantize(chunk):
+def _worker_quantize(chunk, decoder="coset"):
     """Worker function to quantize a chunk of vectors."""
     # Each worker creates its own lattice instance to avoid sharing state if any
-    leech = LeechLattice()
+    leech = LeechLattice(decoder=decoder)
     return leech.quantify_batch(chunk)
 
+def _worker_quantize_indexed(task, decoder="coset"):
+    """Pipelined worker: quantizes one chunk and returns (start, int16 centroids, busy seconds)."""
+    start, chunk = task
+    t0 = time.perf_counter()
+    centroids = codec.to_coords(LeechLattice(decoder=decoder).quantify_batch(chunk))
+    return start, centroids, time.perf_counter() - t0
+
+# Per-process state of the shared-memory workers, set once by _init_shared_worker
+_SHARED = {}
+
+def _init_shared_worker(in_spec, out_spec, decoder="coset"):
+    """Pool initializer: attaches the shared input/output buffers and loads the decoder tables once."""
+    for name, (shm_name, shape, dtype) in (("in", in_spec), ("out", out_spec)):
+        shm = shared_memory.SharedMemory(name=shm_name)
+        _SHARED[name + "_shm"] = shm  # keep the mapping alive
+        _SHARED[name] = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+    _SHARED["leech"] = LeechLattice(decoder=decoder)
+    # Only what quantify_batch reads; the neighbor tables are ~10 MB each and never used here
+    tables.warm(["golay_codewords", "golay_c2"])
+
+def _worker_quantize_range(task):
+    """Shared-memory worker: quantizes rows [start, stop) in place; returns (start, stop, busy seconds)."""
+    start, stop = task
+    t0 = time.perf_counter()
+    _SHARED["out"][start:stop] = codec.to_coords(_SHARED["leech"].quantify_batch(_SHARED["in"][start:stop]))
+    return start, stop, time.perf_counter() - t0
+
+def _worker_quantize_source(task, decoder="coset"):
+    """Job worker: quantizes rows [start, stop) of a memmapped .npy source opened once per process."""
+    source, start, stop = task
+    sources = _SHARED.setdefault("sources", {})
+    if source not in sources:
+        sources[source] = np.load(source, mmap_mode='r')
+    if "leech" not in _SHARED or _SHARED["leech"].decoder != decoder:
+        _SHARED["leech"] = LeechLattice(decoder=decoder)
+    t0 = time.perf_counter()
+    centroids = codec.to_coords(_SHARED["leech"].quantify_batch(np.asarray(sources[source][start:stop])))
+    return start, centroids, time.perf_counter() - t0
+
+@contextmanager
+def _shared_buffers(vectors):
+    """
+    Copies `vectors` into a shared-memory block and allocates a shared (N, 24)
+    int16 centroid buffer. Yields (input spec, output spec, output array);
+    both blocks are unlinked on exit.
+    """
+    vectors = np.ascontiguousarray(vectors)
+    blocks = []
+    try:
+        in_shm = shared_memory.SharedMemory(create=True, size=max(vectors.nbytes, 1))
+        blocks.append(in_shm)
+        np.ndarray(vectors.shape, dtype=vectors.dtype, buffer=in_shm.buf)[:] = vectors
+        out_shape = (len(vectors), codec.DIM)
+        out_shm = shared_memory.SharedMemory(create=True, size=max(len(vectors) * codec.KEY_BYTES, 1))
+        blocks.append(out_shm)
+        out = np.ndarray(out_shape, dtype=codec.KEY_DTYPE, buffer=out_shm.buf)
+        yield ((in_shm.name, vectors.shape, vectors.dtype.str),
+               (out_shm.name, out_shape, codec.KEY_DTYPE.str), out)
+        del out
+    finally:
+        for shm in blocks:
+            shm.close()
+            shm.unlink()
+
 class ParallelLeechIndexer:
     """
     High-performance indexer using multiprocessing to saturate CPU cores
     for the 4096-coset Leech math.
+
+    backend="processes" (default) quantizes chunks in a process pool.
+    backend="threads" runs LeechLattice.quantify_batch on a persistent thread
+    pool instead: no pickling of chunks or results and one shared copy of the
+    lattice tables.
+    backend="shared_memory" keeps process workers but places the input matrix
+    and the int16 centroid output in multiprocessing.shared_memory. Workers
+    start once, load the lattice tables once and receive only (start, stop)
+    offsets, so neither vectors nor centroids are pickled.
+
+    resume(job_id) runs a checkpointed job recorded with LeechDB.create_job:
+    pending chunks are quantized by the workers straight from the memmapped
+    source and each chunk is committed together with its manifest entry.
+
+    index_pipelined() overlaps the two stages: finished chunks stream out of
+    the workers (imap_unordered) into a bounded queue that a dedicated writer
+    thread drains into LeechDB, so wall time approaches max(quantize, write)
+    instead of their sum.
+
+    `decoder` is passed to LeechDB (None: the DB's recorded decoder) and the
+    workers always quantize with the decoder the DB was built with.
     """
-    def __init__(self, db_path="leech_parallel.db", num_workers=None):
+    BACKENDS = ("processes", "threads", "shared_memory")
+
+    def __init__(self, db_path="leech_parallel.db", num_workers=None, backend="processes", decoder=None):
+        if backend not in self.BACKENDS:
+            raise ValueError(f"Unknown backend '{backend}'. Use one of {self.BACKENDS}.")
         self.db_path = db_path
+        self.decoder = decoder
         self.num_workers = num_workers or mp.cpu_count()
-        print(f"Parallel Indexer initialized with {self.num_workers} workers.")
+        self.backend = backend
+        print(f"Parallel Indexer initialized with {self.num_workers} workers ({backend}).")
 
     def index_large_dataset(self, labels, vectors, chunk_size=1000):
         """
         Splits a massive dataset into chunks and processes them in parallel.
         """
-        db = LeechDB(self.db_path)
+        db = LeechDB(self.db_path, decoder=self.decoder)
         num_total = len(vectors)
         print(f"Starting parallel index of {num_total} vectors...")
         
         start_time = time.time()
         
-        # Split data into chunks for workers
-        # We use a larger chunk size for workers to minimize IPC overhead
-        worker_chunk_size = max(100, num_total // (self.num_workers * 2))
-        chunks = [vectors[i:i + worker_chunk_size] for i in range(0, num_total, worker_chunk_size)]
-        
-        print(f"Processing {len(chunks)} worker chunks...")
-        
-        with mp.Pool(processes=self.num_workers) as pool:
-            # Step 1: Quantize in parallel
-            all_centroids = pool.map(_worker_quantize, chunks)
+        if self.backend == "threads":
+            # Step 1: Quantize in parallel threads writing into one output array
+            centroids = db.leech.quantify_batch(vectors, n_threads=self.num_workers)
+        elif self.backend == "shared_memory":
+            # Step 1: Workers quantize row ranges straight into the shared output buffer
+            worker_chunk_size = max(100, num_total // (self.num_workers * 4))
+            ranges = [(i, min(i + worker_chunk_size, num_total)) for i in range(0, num_total, worker_chunk_size)]
+            print(f"Processing {len(ranges)} shared-memory ranges...")
+            with _shared_buffers(vectors) as (in_spec, out_spec, out):
+                with mp.Pool(processes=self.num_workers, initializer=_init_shared_worker,
+                             initargs=(in_spec, out_spec, db.leech.decoder)) as pool:
+                    pool.map(_worker_quantize_range, ranges)
+                centroids = out.copy()
+        else:
+            # Split data into chunks for workers
+            # We use a larger chunk size for workers to minimize IPC overhead
+            worker_chunk_size = max(100, num_total // (self.num_workers * 2))
+            chunks = [vectors[i:i + worker_chunk_size] for i in range(0, num_total, worker_chunk_size)]
+            
+            print(f"Processing {len(chunks)} worker chunks...")
             
-        # Flatten results
-        centroids = np.vstack(all_centroids)
+            with mp.Pool(processes=self.num_workers) as pool:
+                # Step 1: Quantize in parallel
+                all_centroids = pool.map(partial(_worker_quantize, decoder=db.leech.decoder), chunks)
+                
+            # Flatten results
+            centroids = np.vstack(all_centroids)
         
         # Step 2: Sequential DB write (using precomputed centroids)
         print("Quantization complete. Writing to LeechDB...")
         db_batch_size = chunk_size
         for i in range(0, num_total, db_batch_size):
             end_idx = min(i + db_batch_size, num_total)
-            db.index_batch_precomputed(labels[i:end_idx], centroids[i:end_idx])
+            db.index_batch_precomputed(labels[i:end_idx], centroids[i:end_idx], commit=False,
+                                       vectors=vectors[i:end_idx])
+        db.commit()
             
         total_duration = time.time() - start_time
         print(f"Parallel Indexing Complete: {total_duration:.2f}s ({num_total/total_duration:.2f} vectors/sec)")
         db.close()
 
+    def index_pipelined(self, labels, vectors, chunk_size=2000, queue_size=8, commit_every=50000):
+        """
+        Pipelined variant of index_large_dataset. Quantized chunks are written
+        as they arrive (in completion order) while the workers keep going; at
+        most `queue_size` finished chunks wait in memory. Commits every
+        `commit_every` rows. Returns per-stage timings and throughput.
+
+        If the writer fails, quantization stops at the next chunk (the pool is
+        terminated) and the writer's exception is raised.
+        """
+        db = LeechDB(self.db_path, decoder=self.decoder)
+        num_total = len(vectors)
+        print(f"Starting pipelined index of {num_total} vectors...")
+        done = queue.Queue(maxsize=queue_size)
+        stats = {"quantize_busy": 0.0, "write_busy": 0.0, "chunks": 0}
+        errors = []
+        # Set by the writer on failure so the producer stops quantizing
+        writer_failed = threading.Event()
+
+        def writer():
+            uncommitted = 0
+            try:
+                while True:
+                    item = done.get()
+                    if item is None:
+                        break
+                    start, centroids = item
+                    stop = start + len(centroids)
+                    t0 = time.perf_counter()
+                    db.index_batch_precomputed(labels[start:stop], centroids, commit=False,
+                                               vectors=vectors[start:stop])
+                    uncommitted += len(centroids)
+                    if uncommitted >= commit_every:
+                        db.commit()
+                        uncommitted = 0
+                    stats["write_busy"] += time.perf_counter() - t0
+                    stats["chunks"] += 1
+                db.commit()
+            except Exception as e:
+                errors.append(e)
+                writer_failed.set()
+                # Keep draining so the producer never blocks on a dead writer
+                while done.get() is not None:
+                    pass
+
+        writer_thread = threading.Thread(target=writer, name="leech-writer")
+        writer_thread.start()
+        start_time = time.time()
+        try:
+            tasks = ((i, vectors[i:i + chunk_size]) for i in range(0, num_total, chunk_size))
+            if self.backend == "threads":
+                leech = db.leech
+                for start, chunk in tasks:
+                    if writer_failed.is_set():
+                        break
+                    t0 = time.perf_counter()
+                    centroids = codec.to_coords(leech.quantify_batch(chunk, n_threads=self.num_workers))
+                    stats["quantize_busy"] += time.perf_counter() - t0
+                    done.put((start, centroids))
+            elif self.backend == "shared_memory":
+                ranges = [(i, min(i + chunk_size, num_total)) for i in range(0, num_total, chunk_size)]
+                with _shared_buffers(vectors) as (in_spec, out_spec, out):
+                    with mp.Pool(processes=self.num_workers, initializer=_init_shared_worker,
+                                 initargs=(in_spec, out_spec, db.leech.decoder)) as pool:
+                        for start, stop, busy in pool.imap_unordered(_worker_quantize_range, ranges):
+                            if writer_failed.is_set():
+                                pool.terminate()
+                                break
+                            stats["quantize_busy"] += busy
+                            # Copy: the shared block is released once the pool is done
+                            done.put((start, out[start:stop].copy()))
+            else:
+                worker = partial(_worker_quantize_indexed, decoder=db.leech.decoder)
+                with mp.Pool(processes=self.num_workers) as pool:
+                    for start, centroids, busy in pool.imap_unordered(worker, tasks):
+                        if writer_failed.is_set():
+                            pool.terminate()
+                            break
+                        stats["quantize_busy"] += busy
+                        done.put((start, centroids))
+        finally:
+            done.put(None)
+            writer_thread.join()
+            db.close()
+        if errors:
+            raise errors[0]
+
+        wall = time.time() - start_time
+        # Worker busy time is summed over processes; divide by the worker count for stage wall time
+        quantize_wall = stats["quantize_busy"] / (1 if self.backend == "threads" else self.num_workers)
+        report = {
+            "vectors": num_total,
+            "chunks": stats["chunks"],
+            "wall_seconds": wall,
+            "quantize_seconds": quantize_wall,
+            "write_seconds": stats["write_busy"],
+            "quantize_vectors_per_sec": num_total / quantize_wall if quantize_wall else float("inf"),
+            "write_vectors_per_sec": num_total / stats["write_busy"] if stats["write_busy"] else float("inf"),
+            "vectors_per_sec": num_total / wall if wall else float("inf"),
+        }
+        print(f"Pipelined Indexing Complete: {wall:.2f}s ({report['vectors_per_sec']:.2f} vectors/sec) | "
+              f"quantize {quantize_wall:.2f}s ({report['quantize_vectors_per_sec']:.2f}/s), "
+              f"write {stats['write_busy']:.2f}s ({report['write_vectors_per_sec']:.2f}/s)")
+        return report
+
+    def resume(self, job_id):
+        """
+        Runs or continues a checkpointed job (see LeechDB.create_job). Only the
+        chunks not yet committed are processed; a crash loses at most the
+        chunks in flight. Returns the job status afterwards.
+        """
+        db = LeechDB(self.db_path, decoder=self.decoder)
+        try:
+            vectors, label_prefix = db.job_source(job_id)
+            source = db.job_status(job_id)["source"]
+            pending = db.pending_chunks(job_id)
+            chunk_of = {start: (chunk_index, stop) for chunk_index, start, stop in pending}
+            print(f"Resuming job '{job_id}': {len(pending)} chunks pending...")
+            start_time = time.time()
+
+            def commit(start, centroids):
+                chunk_index, stop = chunk_of[start]
+                db.commit_job_chunk(job_id, chunk_index, start, centroids, vectors[start:stop], label_prefix)
+
+            if self.backend == "threads":
+                leech = db.leech
+                for _, start, stop in pending:
+                    commit(start, leech.quantify_batch(np.asarray(vectors[start:stop]), n_threads=self.num_workers))
+            else:
+                # Workers read the memmapped source themselves; only offsets and int16 centroids cross IPC
+                with mp.Pool(processes=self.num_workers) as pool:
+                    tasks = [(source, start, stop) for _, start, stop in pending]
+                    worker = partial(_worker_quantize_source, decoder=db.leech.decoder)
+                    for start, centroids, _ in pool.imap_unordered(worker, tasks):
+                        commit(start, centroids)
+
+            status = db.job_status(job_id)
+            print(f"Job '{job_id}' {status['status']}: {status['committed_rows']}/{status['num_rows']} rows "
+                  f"in {time.time() - start_time:.2f}s")
+            return status
+        finally:
+            db.close()
+
 if __name__ == "__main__":
     # Test with 20,000 vectors to verify speedup
     num_test = 20000
@@ -4,43 +4,49 @@ import os
 from leech_db import LeechDB
 from parallel_indexer import ParallelLeechIndexer
 
-def push_million_vectors():
+def _write_million_dataset(npy_path, num_total, dim, batch_size):
+    """ Generates the clustered benchmark vectors once, chunk by chunk, into a .npy file. """
+    np.random.seed(42)
+    data = np.lib.format.open_memmap(npy_path + ".tmp", mode="w+", dtype=np.float32, shape=(num_total, dim))
+    for i in range(0, num_total, batch_size):
+        # Simulate structured data clusters to test SQLite group_by performance
+        # Using 1000 core "concept" centers
+        centers = np.random.randn(1000, dim) * 5.0
+        data[i:i + batch_size] = centers[np.random.randint(0, 1000, batch_size)] + np.random.normal(0, 0.1, (batch_size, dim))
+    data.flush()
+    del data
+    os.replace(npy_path + ".tmp", npy_path)
+
+def push_million_vectors(restart=False):
     print("--- EMPIRE SCALE: 1,000,000 VECTOR INGESTION TEST ---")
     db_path = "leech_empire_million.db"
-    if os.path.exists(db_path):
+    npy_path = "leech_empire_million.npy"
+    if restart and os.path.exists(db_path):
         os.remove(db_path)
     
-    db = LeechDB(db_path)
     num_total = 1000000
-    batch_size = 50000 # Large batches to leverage the SQL Staging Table optimization
+    batch_size = 50000 # Large chunks, each committed together with its job manifest entry
     dim = 24
-    
-    np.random.seed(42)
-    
-    print(f"Target: {num_total} vectors across {num_total // batch_size} major bulk commits.")
+
+    if not os.path.exists(npy_path):
+        print(f"Generating {num_total} vectors into {npy_path}...")
+        _write_million_dataset(npy_path, num_total, dim, batch_size)
+
+    # The job manifest lives in the DB: re-running this script resumes after the last committed chunk
+    db = LeechDB(db_path)
+    job_id = db.create_job(npy_path, job_id="million", chunk_size=batch_size, label_prefix="identity_")
+    db.close()
+
+    print(f"Target: {num_total} vectors across {num_total // batch_size} checkpointed chunks.")
     start_total = time.time()
-    
-    for i in range(0, num_total, batch_size):
-        chunk_labels = [f"identity_{j}" for j in range(i, i + batch_size)]
-        # Simulate structured data clusters to test SQLite group_by performance
-        # Using 1000 core "concept" centers
-        centers = np.random.randn(1000, dim) * 5.0
-        chunk_data = centers[np.random.randint(0, 1000, batch_size)] + np.random.normal(0, 0.1, (batch_size, dim))
-        
-        start_batch = time.time()
-        # Use our new C-optimized staging table engine
-        db.index_million_bulk(chunk_labels, chunk_data)
-        batch_time = time.time() - start_batch
-        print(f"Bulk Commit {i//batch_size + 1}: {batch_size} vectors in {batch_time:.2f}s")
+    status = ParallelLeechIndexer(db_path).resume(job_id)
         
     total_time = time.time() - start_total
-    print(f"\nSUCCESS: 1,000,000 Vector Ingestion Complete!")
+    print(f"\nSUCCESS: {status['committed_rows']} Vector Ingestion Complete!")
     print(f"Total Time: {total_time:.2f}s")
-    print(f"Throughput: {num_total/total_time:.2f} vectors/sec")
     
     db_size = os.path.getsize(db_path) / (1024 * 1024)
     print(f"Final DB Size: {db_size:.2f} MB")
-    db.close()
 
 if __name__ == "__main__":
     push_million_vectors()
@@ -1,6 +1,5 @@
 import numpy as np
 import time
-from core.lattices import LeechLattice
 from leech_hash import LeechHash
 
 def scale_test():
@@ -26,8 +25,7 @@ def scale_test():
     # 2. Bulk Indexing
     print(f"Indexing {num_vectors} vectors...")
     start_time = time.time()
-    for i in range(num_vectors):
-        lh.index(labels[i], data[i])
+    lh.index_many(labels, np.array(data))
     index_time = time.time() - start_time
     print(f"Indexing complete in {index_time:.2f} seconds ({num_vectors/index_time:.2f} vectors/sec)")
     
@@ -45,21 +43,7 @@ def scale_test():
     # Neighborhood lookup (Recall boost)
     print("Neighborhood lookup (checking ~200k potential buckets)...")
     start_time = time.time()
-    # Note: Vectorized key-distance check is the fastest scaling method
-    if not lh.table:
-        neighborhood_results = []
-    else:
-        table_keys = np.array(list(lh.table.keys()))
-        diffs = table_keys - central_q
-        dists_sq = np.sum(diffs**2, axis=1)
-        # Using a small tolerance for floating point comparisons
-        neighbor_keys = table_keys[np.abs(dists_sq - 32.0) < 1e-5]
-        
-        neighborhood_results = []
-        for nk in neighbor_keys:
-            neighborhood_results.extend(lh.table.get(tuple(nk.tolist()), []))
-        neighborhood_results = list(set(neighborhood_results))
-        
+    neighborhood_results = lh.lookup_neighborhood(query_vec)
     neigh_time = time.time() - start_time
     print(f"Neighborhood lookup time: {neigh_time:.2f} seconds")
     print(f"Neighborhood matches found: {len(neighborhood_results)}")
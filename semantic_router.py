@@ -1,16 +1,22 @@
 import numpy as np
-from core.lattices import LeechLattice
 from leech_db import LeechDB
+from core import codec
+from core.cache import LRUCache
 
 class SemanticRouter:
     """
     Routes high-dimensional embeddings to specialized 'Expert' handlers
     based on their position in the Leech Lattice.
+
+    Routing decisions are cached per packed centroid key (cache_size=0
+    disables this); registering an expert clears the cache.
     """
-    def __init__(self, db_path="leech_empire_100k.db"):
-        self.leech = LeechLattice()
-        self.db = LeechDB(db_path)
-        self.experts = {} # Map of centroid_id -> expert_label
+    def __init__(self, db_path="leech_empire_100k.db", cache_size=4096, cache_ttl=None, decoder=None):
+        self.db = LeechDB(db_path, decoder=decoder)
+        # Route with the decoder the DB was indexed with
+        self.leech = self.db.leech
+        self.experts = {} # Map of packed centroid key -> expert_label
+        self.cache = LRUCache(cache_size, cache_ttl)
 
     def register_expert(self, expert_label, example_vectors):
         """
@@ -18,17 +24,25 @@ class SemanticRouter:
         """
         print(f"Registering expert: {expert_label}...")
         centroids = self.leech.quantify_batch(np.array(example_vectors))
-        for c in centroids:
-            key = self.db._centroid_to_key(c)
+        for key in codec.pack_keys(centroids):
             self.experts[key] = expert_label
+        # New expert regions can change the route of any nearby point
+        self.cache.clear()
 
     def route(self, vector):
         """
         Snaps the input to the lattice and routes to the nearest registered expert.
         """
         q = self.leech.quantify(vector)
-        key = self.db._centroid_to_key(q)
-        
+        key = codec.pack_key(q)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+        result = self._route_point(q, key)
+        self.cache.put(key, result)
+        return result
+
+    def _route_point(self, q, key):
         # 1. Direct Hit
         if key in self.experts:
             return self.experts[key], "DIRECT"
@@ -36,11 +50,11 @@ class SemanticRouter:
         # 2. Neighborhood Search (Fuzzy Routing)
         # If the exact point isn't an expert, check neighbors
         min_vecs = self.leech.get_minimal_vectors()
-        for v in min_vecs:
-            for neighbor in [q + v, q - v]:
-                n_key = self.db._centroid_to_key(neighbor)
-                if n_key in self.experts:
-                    return self.experts[n_key], "NEIGHBORHOOD"
+        # Candidates in the original order: q + v, q - v for each minimal vector v
+        neighbors = np.stack((q + min_vecs, q - min_vecs), axis=1).reshape(-1, 24)
+        for n_key in codec.pack_keys(neighbors):
+            if n_key in self.experts:
+                return self.experts[n_key], "NEIGHBORHOOD"
         
         return "GENERAL_MODEL", "FALLBACK"
 
@@ -0,0 +1,181 @@
+import os
+import time
+import multiprocessing as mp
+import numpy as np
+from functools import partial
+from core import codec
+from leech_db import LeechDB
+from parallel_indexer import _worker_quantize
+
+def _ingest_shard(task):
+    """Worker function: appends one shard's precomputed centroids in its own process."""
+    shard_path, storage, decoder, labels, coords = task
+    db = LeechDB(shard_path, storage=storage, decoder=decoder)
+    db.index_batch_precomputed(labels, coords)
+    db.close()
+    return len(labels)
+
+class ShardedLeechDB:
+    """
+    LeechDB partitioned across `num_shards` SQLite files.
+
+    A bucket lives in shard mix64(fingerprint64(centroid)) % num_shards (the
+    raw fingerprint is linear and always 0 mod 4 on the lattice), so every
+    shard has its own writer lock and a B-tree small enough to stay in page
+    cache. index_parallel() quantizes in a process pool and then writes all
+    shards at once, one process per shard. Queries route each probed key to
+    the shard that owns it and fan out only to those shards.
+
+    Shard files are named <base>.shardNN.db next to `base_path`; the shard
+    count and routing hash are recorded in each shard's meta table and
+    checked on open. Every shard must use the same decoder (see LeechDB).
+    """
+    ROUTING = "mix64"
+
+    def __init__(self, base_path="leech_sharded.db", num_shards=4, storage="postings", decoder=None):
+        self.num_shards = num_shards
+        self.storage = storage
+        stem, ext = os.path.splitext(base_path)
+        self.shard_paths = [f"{stem}.shard{i:02d}{ext or '.db'}" for i in range(num_shards)]
+        self.shards = [LeechDB(path, storage=storage, decoder=decoder) for path in self.shard_paths]
+        decoders = {shard.leech.decoder for shard in self.shards}
+        if len(decoders) > 1:
+            raise ValueError(f"Shards of {base_path} were indexed with different decoders: {sorted(decoders)}")
+        self.leech = self.shards[0].leech
+
+        for i, shard in enumerate(self.shards):
+            recorded = shard._get_meta("num_shards")
+            if recorded is not None and int(recorded) != num_shards:
+                raise ValueError(f"{self.shard_paths[i]} belongs to a {recorded}-shard index, not {num_shards}")
+            routing = shard._get_meta("shard_routing")
+            if recorded is not None and routing != self.ROUTING:
+                raise ValueError(f"{self.shard_paths[i]} was routed with the unmixed fingerprint; re-index it")
+            shard._set_meta("num_shards", num_shards)
+            shard._set_meta("shard_routing", self.ROUTING)
+            shard._set_meta("shard_index", i)
+            shard.commit()
+
+    def shard_of(self, centroids):
+        """ Returns the owning shard index of each centroid. """
+        return self._shard_of_fingerprints(codec.fingerprint64(centroids))
+
+    def _shard_of_fingerprints(self, fps):
+        return (codec.mix64(fps) % np.uint64(self.num_shards)).astype(np.intp)
+
+    def _partition(self, labels, centroids):
+        """ Yields (shard index, labels, int16 coords) for each non-empty shard. """
+        coords = codec.to_coords(centroids)
+        owners = self.shard_of(coords)
+        labels = np.asarray(labels, dtype=object)
+        for i in range(self.num_shards):
+            mask = owners == i
+            if mask.any():
+                yield i, labels[mask].tolist(), coords[mask]
+
+    def index_batch(self, labels, vectors):
+        """ Quantizes in-process and appends each shard's part in turn. """
+        vectors = np.asarray(vectors)
+        if vectors.ndim == 1:
+            vectors = vectors.reshape(1, -1)
+        centroids = self.leech.quantify_batch(vectors)
+        for i, shard_labels, coords in self._partition(labels, centroids):
+            self.shards[i].index_batch_precomputed(shard_labels, coords)
+
+    def index_parallel(self, labels, vectors, num_workers=None):
+        """
+        Quantizes `vectors` in a process pool, then ingests all shards
+        concurrently, one worker process per shard.
+        """
+        num_workers = num_workers or mp.cpu_count()
+        num_total = len(vectors)
+        start_time = time.time()
+
+        worker_chunk_size = max(100, num_total // (num_workers * 2))
+        chunks = [vectors[i:i + worker_chunk_size] for i in range(0, num_total, worker_chunk_size)]
+        with mp.Pool(processes=num_workers) as pool:
+            centroids = np.vstack(pool.map(partial(_worker_quantize, decoder=self.leech.decoder), chunks))
+            quantize_time = time.time() - start_time
+
+            tasks = [(self.shard_paths[i], self.storage, self.leech.decoder, shard_labels, coords)
+                     for i, shard_labels, coords in self._partition(labels, centroids)]
+            pool.map(_ingest_shard, tasks, chunksize=1)
+
+        # Shards were written by other processes: reload the occupied sets lazily
+        for shard in self.shards:
+            shard.refresh_occupied()
+
+        total_time = time.time() - start_time
+        print(f"Sharded Indexing Complete: {num_total} vectors into {len(tasks)} shards in {total_time:.2f}s "
+              f"(quantize {quantize_time:.2f}s, {num_total/total_time:.2f} vectors/sec)")
+
+    def _fetch(self, points):
+        """ Fetches the buckets of `points` from their owning shards: {packed key: [labels]}. """
+        found = {}
+        if not len(points):
+            return found
+        owners = self.shard_of(points)
+        for i in np.unique(owners):
+            shard = self.shards[i]
+            keys = shard._centroids_to_keys(points[owners == i])
+            for key, labels in shard._fetch_buckets(keys).items():
+                found[key] = labels
+        return found
+
+    def query_exact(self, vector):
+        return self.query_exact_batch(np.asarray(vector).reshape(1, -1))[0]
+
+    def query_exact_batch(self, vectors):
+        """ Batch exact lookup; one fetch per shard touched. Returns one label list per row. """
+        vectors = np.asarray(vectors)
+        if vectors.ndim == 1:
+            vectors = vectors.reshape(1, -1)
+        centroids = self.leech.quantify_batch(vectors)
+        found = self._fetch(centroids)
+        return [list(found.get(key, [])) for key in codec.pack_keys(centroids)]
+
+    def query_multiprobe(self, vector, probes=4):
+        """ Multi-probe lookup across shards, labels nearest probe first (see LeechDB.query_multiprobe). """
+        points, _ = self.leech.quantify_topk(np.asarray(vector).reshape(1, -1), probes)
+        found = self._fetch(points[0])
+
+        results = []
+        for key in codec.pack_keys(points[0]):
+            results.extend(found.get(key, []))
+        return list(dict.fromkeys(results))
+
+    def query_neighborhood(self, vector):
+        """
+        Labels in the nearest lattice point and all its neighbors. Candidate
+        fingerprints are routed to their owning shard and checked against that
+        shard's occupied set; only the hits are fetched.
+        """
+        central_q = np.round(self.leech.quantify(vector)).astype(np.int64)
+        offsets = self.leech.get_neighbor_offsets()
+        with np.errstate(over='ignore'):
+            candidate_fps = codec.fingerprint64(central_q)[0] + self.shards[0]._neighbor_fingerprints()
+        owners = self._shard_of_fingerprints(candidate_fps)
+
+        hits = np.zeros(len(offsets), dtype=bool)
+        for i in range(self.num_shards):
+            mask = owners == i
+            hits[mask] = self.shards[i]._occupied_set().contains(candidate_fps[mask])
+        points = np.vstack((central_q, central_q + offsets[hits]))
+
+        results = []
+        for labels in self._fetch(points).values():
+            results.extend(labels)
+        return list(set(results))
+
+    def close(self):
+        for shard in self.shards:
+            shard.close()
+
+if __name__ == "__main__":
+    num_test = 20000
+    test_data = np.random.randn(num_test, 24).astype(np.float32) * 5.0
+    test_labels = [f"shard_item_{i}" for i in range(num_test)]
+
+    db = ShardedLeechDB("leech_sharded_test.db", num_shards=4)
+    db.index_parallel(test_labels, test_data)
+    print(f"Query for shard_item_0: {db.query_exact(test_data[0])}")
+    db.close()
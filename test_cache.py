@@ -0,0 +1,28 @@
+import time
+from core.cache import LRUCache
+
+def test_lru_cache():
+    cache = LRUCache(maxsize=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1  # "a" becomes most recently used
+    cache.put("c", 3)           # evicts "b"
+    assert cache.get("b") is None and cache.get("c") == 3
+    assert cache.invalidate(["a", "missing"]) == 1 and "a" not in cache
+
+    stats = cache.stats()
+    print(f"LRU stats: {stats}")
+    assert (stats["hits"], stats["misses"], stats["evictions"], stats["size"]) == (2, 1, 1, 1)
+
+    ttl_cache = LRUCache(maxsize=4, ttl=0.05)
+    ttl_cache.put("x", 1)
+    assert ttl_cache.get("x") == 1
+    time.sleep(0.06)
+    assert ttl_cache.get("x") is None and len(ttl_cache) == 0
+
+    disabled = LRUCache(maxsize=0)
+    disabled.put("x", 1)
+    assert disabled.get("x") is None
+
+if __name__ == "__main__":
+    test_lru_cache()
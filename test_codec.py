@@ -0,0 +1,43 @@
+import numpy as np
+from core import codec
+from core.lattices import LeechLattice
+
+def test_codec_round_trip():
+    np.random.seed(1)
+    points = LeechLattice(decoder="golay").quantify_batch(np.random.randn(500, 24) * 10.0)
+
+    keys = codec.pack_keys(points)
+    print(f"Key width: {len(keys[0])} bytes")
+    assert all(len(k) == codec.KEY_BYTES for k in keys)
+    assert keys[0] == codec.pack_key(points[0])
+    assert np.array_equal(codec.unpack_keys(keys), points)
+    assert np.array_equal(codec.unpack_keys(codec.pack_array(points)), points)
+
+    # Equal points give equal keys and fingerprints, distinct points distinct ones
+    unique_points = np.unique(points, axis=0)
+    assert len(set(keys)) == len(unique_points)
+    fp = codec.fingerprint64(points)
+    assert fp.dtype == np.int64
+    assert len(np.unique(fp)) == len(unique_points)
+
+def test_fingerprint_is_stable():
+    # Fingerprints are persisted in snapshots and route shards: pin the exact values
+    assert len(codec._FP_MULTIPLIERS) == codec.DIM and np.all(codec._FP_MULTIPLIERS % 2 == 1)
+    fp = codec.fingerprint64(np.arange(24) - 12)
+    print(f"Fingerprint of (-12, ..., 11): {fp[0]}")
+    assert fp[0] == -5234952737055529844
+
+def test_residual_codes():
+    np.random.seed(2)
+    residuals = np.random.randn(100, 24)
+    for fmt, tol in (("float16", 1e-3), ("int8", 2e-2)):
+        codes, scales = codec.encode_residuals(residuals, fmt)
+        decoded = codec.decode_residuals(codes, scales, fmt)
+        err = np.max(np.abs(decoded - residuals))
+        print(f"{fmt}: {len(codes[0])} bytes per residual, max error {err:.4f}")
+        assert err < tol
+
+if __name__ == "__main__":
+    test_codec_round_trip()
+    test_fingerprint_is_stable()
+    test_residual_codes()
@@ -0,0 +1,424 @@
+import os
+import tempfile
+import threading
+import numpy as np
+from leech_db import LeechDB
+
+def _temp_db_path():
+    return os.path.join(tempfile.mkdtemp(), "test_index.db")
+
+def test_postings_storage():
+    db = LeechDB(_temp_db_path())
+    assert db.storage == "postings" and db.key_format == "binary"
+
+    np.random.seed(0)
+    data = np.random.randn(200, 24) * 5.0
+    labels = [f"item_{i}" for i in range(200)]
+    db.index_batch(labels, data)
+    db.index_batch(labels[:10], data[:10])  # Re-indexing is idempotent
+
+    results = db.query_exact(data[0])
+    print(f"Postings query for item_0: {results}")
+    assert results == ["item_0"]
+    count = db.conn.execute("SELECT COUNT(*) FROM postings").fetchone()[0]
+    assert count == 200
+    db.close()
+
+def test_label_validation():
+    np.random.seed(15)
+    data = np.random.randn(3, 24) * 5.0
+    for storage in LeechDB.STORAGE_FORMATS:
+        db = LeechDB(_temp_db_path(), storage=storage)
+        try:
+            db.index_batch(["ok", None, "also_ok"], data)
+            raise AssertionError("None label was accepted")
+        except ValueError:
+            pass
+        # Non-string labels are stored (and returned) as their str() form
+        db.index_batch([7, "eight", 9.5], data)
+        print(f"{storage} labels: {db.query_exact_batch(data)}")
+        assert db.query_exact_batch(data) == [["7"], ["eight"], ["9.5"]]
+        db.close()
+
+def test_decoder_recorded():
+    path = _temp_db_path()
+    np.random.seed(19)
+    data = np.random.randn(100, 24) * 5.0
+    db = LeechDB(path, decoder="golay")
+    db.index_batch([f"item_{i}" for i in range(100)], data)
+    assert db.leech.decoder == "golay" and db.query_exact(data[3]) == ["item_3"]
+    db.close()
+
+    # Reopening picks up the recorded decoder; a different one is refused
+    db = LeechDB(path)
+    assert db.leech.decoder == "golay" and db.query_exact(data[3]) == ["item_3"]
+    db.close()
+    try:
+        LeechDB(path, decoder="coset")
+        raise AssertionError("Opened a golay DB with the coset decoder")
+    except ValueError as e:
+        print(f"Decoder mismatch: {e}")
+
+    # Databases that hold rows but predate the recorded decoder are coset databases
+    path = _temp_db_path()
+    db = LeechDB(path)
+    db.index_batch(["legacy"], data[:1])
+    db.conn.execute("DELETE FROM meta WHERE key = 'decoder'")
+    db.conn.commit()
+    db.close()
+    assert LeechDB(path).leech.decoder == "coset"
+
+def test_migrate_json_to_postings():
+    path = _temp_db_path()
+    db = LeechDB(path, storage="json")
+    np.random.seed(1)
+    data = np.random.randn(100, 24) * 5.0
+    labels = [f"item_{i}" for i in range(100)]
+    db.index_batch(labels, data)
+    before = [sorted(db.query_exact(v)) for v in data]
+    db.close()
+
+    db = LeechDB(path)
+    assert db.storage == "json"
+    db.migrate_to_postings()
+    assert db.storage == "postings"
+    after = [sorted(db.query_exact(v)) for v in data]
+    print(f"Migrated {len(data)} vectors, results preserved: {before == after}")
+    assert before == after
+    db.close()
+
+def test_index_batch_precomputed():
+    db = LeechDB(_temp_db_path())
+    np.random.seed(2)
+    data = np.random.randn(300, 24) * 5.0
+    labels = [f"item_{i}" for i in range(300)]
+    centroids = db.leech.quantify_batch(data)
+
+    # Deferred commits across several batches, committed once at the end
+    for i in range(0, 300, 100):
+        db.index_batch_precomputed(labels[i:i + 100], centroids[i:i + 100], commit=False)
+    db.commit()
+
+    assert db.query_exact(data[42]) == ["item_42"]
+    assert db.conn.execute("SELECT COUNT(*) FROM postings").fetchone()[0] == 300
+    db.close()
+
+def _scan_neighborhood(db, vector):
+    """ Reference neighborhood: scan every bucket and keep distances 0 and 32. """
+    central = db.leech.quantify(vector)
+    keys = db._all_keys()
+    dists_sq = np.sum((db._keys_to_centroids(keys) - central) ** 2, axis=1)
+    matches = [keys[i] for i in np.where((dists_sq < 0.1) | (np.abs(dists_sq - 32.0) < 0.1))[0]]
+    return sorted(label for labels in db._fetch_buckets(matches).values() for label in labels)
+
+def test_query_neighborhood():
+    for storage in LeechDB.STORAGE_FORMATS:
+        db = LeechDB(_temp_db_path(), storage=storage)
+        np.random.seed(3)
+        data = np.random.randn(200, 24) * 5.0
+        db.index_batch([f"item_{i}" for i in range(200)], data)
+        db.query_neighborhood(data[0])  # Loads the occupied set before the next writes
+
+        # Plant buckets right next to item_0's bucket, ingested after the set was loaded
+        central = db.leech.quantify(data[0])
+        offsets = db.leech.get_neighbor_offsets()[[0, 5000, 150000]]
+        db.index_batch_precomputed(["n_0", "n_1", "n_2"], central + offsets)
+
+        expected = _scan_neighborhood(db, data[0])
+        memory = sorted(db.query_neighborhood(data[0]))
+        sql = sorted(db.query_neighborhood(data[0], strategy="sql"))
+        print(f"{storage} neighborhood of item_0: {memory}")
+        assert {"item_0", "n_0", "n_1", "n_2"} <= set(memory)
+        assert memory == sql == expected
+        db.close()
+
+def test_batch_queries():
+    db = LeechDB(_temp_db_path())
+    np.random.seed(4)
+    data = np.random.randn(300, 24) * 5.0
+    db.index_batch([f"item_{i}" for i in range(300)], data)
+
+    queries = np.vstack((data[:50], data[:5], np.random.randn(20, 24) * 5.0))
+    exact = db.query_exact_batch(queries)
+    assert exact == [db.query_exact(q) for q in queries]
+    assert exact[0] == ["item_0"] and exact[50] == ["item_0"]
+
+    neighborhoods = db.query_neighborhood_batch(queries[:30])
+    assert [sorted(r) for r in neighborhoods] == [sorted(db.query_neighborhood(q)) for q in queries[:30]]
+    print(f"Batch queries match the single-query paths for {len(queries)} queries")
+    db.close()
+
+def test_concurrent_readers():
+    db = LeechDB(_temp_db_path())
+    np.random.seed(5)
+    data = np.random.randn(400, 24) * 5.0
+    db.index_batch([f"item_{i}" for i in range(200)], data[:200])
+    expected = db.query_exact_batch(data[:200])
+
+    errors = []
+    def reader():
+        try:
+            for _ in range(5):
+                assert db.query_exact_batch(data[:200]) == expected
+        except Exception as e:  # surfaced in the main thread below
+            errors.append(e)
+
+    threads = [threading.Thread(target=reader) for _ in range(4)]
+    for t in threads:
+        t.start()
+    # Ingest keeps going on the writer connection while the readers run
+    for i in range(200, 400, 50):
+        db.index_batch_precomputed([f"item_{j}" for j in range(i, i + 50)], db.leech.quantify_batch(data[i:i + 50]))
+    for t in threads:
+        t.join()
+
+    print(f"{len(threads)} reader threads, {db._num_readers} pooled read connections, errors: {errors}")
+    assert not errors
+    assert db.query_exact(data[399]) == ["item_399"]
+    db.close()
+
+def test_reader_pool_is_bounded():
+    db = LeechDB(_temp_db_path(), pool_size=2)
+    np.random.seed(16)
+    data = np.random.randn(50, 24) * 5.0
+    db.index_batch([f"item_{i}" for i in range(50)], data)
+
+    # Many short-lived threads (one per request, as in a threaded server) share the pooled connections
+    errors = []
+    def request(i):
+        try:
+            assert db.query_exact(data[i % 50]) == [f"item_{i % 50}"]
+        except Exception as e:
+            errors.append(e)
+    for start in range(0, 200, 20):
+        threads = [threading.Thread(target=request, args=(i,)) for i in range(start, start + 20)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    print(f"200 request threads served by {db._num_readers} read connections, errors: {errors}")
+    assert not errors
+    assert db._num_readers <= 2 and db._pool.qsize() == db._num_readers
+    db.close()
+
+def test_pooled_reader_sees_new_commits():
+    db = LeechDB(_temp_db_path(), pool_size=1)
+    np.random.seed(17)
+    data = np.random.randn(21, 24) * 5.0
+    db.index_batch([f"item_{i}" for i in range(20)], data[:20])
+
+    # The sql strategy probes ~196k keys through the temp-table join on the single pooled reader
+    assert "item_0" in db.query_neighborhood(data[0], strategy="sql")
+    postings_before = db.bucket_stats()["postings"]
+    db.index_batch(["item_20"], data[20:])
+    print(f"After a join query the reader sees: {db.query_exact(data[20])}, {db.bucket_stats()}")
+    assert db.query_exact(data[20]) == ["item_20"]
+    assert db.bucket_stats()["postings"] == postings_before + 1
+    db.close()
+
+def test_residual_reranking():
+    np.random.seed(7)
+    # Tight clusters so several labels share each bucket
+    centers = np.random.randn(20, 24) * 5.0
+    data = centers[np.arange(400) % 20] + np.random.randn(400, 24) * 0.3
+    labels = [f"item_{i}" for i in range(400)]
+
+    for fmt in ("float16", "int8"):
+        db = LeechDB(_temp_db_path(), residuals=fmt)
+        db.index_batch(labels, data)
+        query = data[0] + np.random.randn(24) * 0.01
+
+        candidates = db.query_neighborhood(query)
+        ranked = db.query_neighborhood(query, top_k=5)
+        true_order = sorted(candidates, key=lambda l: np.sum((data[int(l.split("_")[1])] - query) ** 2))
+        print(f"{fmt}: {len(candidates)} candidates, top 5 re-ranked: {ranked}")
+        assert len(ranked) == 5 and ranked[0] == "item_0"
+        assert ranked == true_order[:5]
+        assert db.query_exact(query, top_k=1) == ["item_0"]
+        db.close()
+
+    # Without residuals, top_k still bounds the response (ranked by bucket centroid)
+    db = LeechDB(_temp_db_path())
+    db.index_batch(labels, data)
+    assert len(db.query_neighborhood(data[0], top_k=3)) == 3
+    db.close()
+
+def test_result_cache_invalidation():
+    db = LeechDB(_temp_db_path(), cache_size=128)
+    np.random.seed(9)
+    data = np.random.randn(100, 24) * 5.0
+    db.index_batch([f"item_{i}" for i in range(100)], data)
+
+    assert db.query_exact(data[0]) == ["item_0"]
+    assert db.query_exact(data[0]) == ["item_0"]
+    neighborhood = db.query_neighborhood(data[0])
+    assert db.query_neighborhood(data[0]) == neighborhood
+    assert db.cache.stats()["hits"] == 2
+
+    # Ingest into the same bucket and into a neighboring bucket invalidates both entries
+    central = db.leech.quantify(data[0])
+    db.index_batch_precomputed(["same", "near"], np.vstack((central, central + db.leech.get_neighbor_offsets()[7])))
+    assert sorted(db.query_exact(data[0])) == ["item_0", "same"]
+    assert sorted(db.query_neighborhood(data[0])) == sorted(neighborhood + ["same", "near"])
+    # Unrelated cached buckets survive
+    db.query_exact(data[1])
+    db.index_batch_precomputed(["far"], central + 100)
+    hits = db.cache.stats()["hits"]
+    db.query_exact(data[1])
+    print(f"Cache stats: {db.cache.stats()}")
+    assert db.cache.stats()["hits"] == hits + 1
+    db.close()
+
+def test_cache_skips_results_read_before_a_commit():
+    db = LeechDB(_temp_db_path(), cache_size=128)
+    np.random.seed(18)
+    data = np.random.randn(10, 24) * 5.0
+    db.index_batch([f"item_{i}" for i in range(1, 10)], data[1:])
+    central = db.leech.quantify(data[0])
+
+    # A writer commits into the bucket while a reader (cache still empty) is fetching it
+    fetch = db._fetch_buckets
+    def racing_fetch(keys):
+        found = fetch(keys)
+        db.index_batch_precomputed(["new"], central)
+        return found
+    db._fetch_buckets = racing_fetch
+    assert db.query_exact(data[0]) == []
+    db._fetch_buckets = fetch
+
+    print(f"After the racing commit: {db.query_exact(data[0])}")
+    assert db.query_exact(data[0]) == ["new"]
+    db.close()
+
+def test_bucket_stats():
+    np.random.seed(10)
+    centers = np.random.randn(30, 24) * 5.0
+    data = centers[np.arange(300) % 30] + np.random.randn(300, 24) * 0.2
+    labels = [f"item_{i}" for i in range(300)]
+
+    for storage in LeechDB.STORAGE_FORMATS:
+        db = LeechDB(_temp_db_path(), storage=storage)
+        db.index_batch(labels[:200], data[:200])
+        db.index_million_bulk(labels[100:], data[100:])  # Overlaps the first batch
+        db.index_batch(labels[:10], data[:10])           # Pure duplicates
+
+        stats = db.bucket_stats()
+        maintained = db.conn.execute("SELECT centroid_id, count FROM bucket_stats ORDER BY centroid_id").fetchall()
+        db._rebuild_bucket_stats(db.conn.cursor())
+        rebuilt = db.conn.execute("SELECT centroid_id, count FROM bucket_stats ORDER BY centroid_id").fetchall()
+        print(f"{storage} stats: {stats}, histogram: {db.bucket_histogram()}")
+        assert maintained == rebuilt
+        assert stats == db.bucket_stats()
+        assert stats["postings"] == 300 and stats["buckets"] == len(rebuilt)
+
+        (centroid, count), = db.largest_buckets(1)
+        assert count == stats["max_bucket_size"] == max(c for _, c in rebuilt)
+        assert len(db.query_exact(centroid)) == count
+        assert sum(k * v for k, v in db.bucket_histogram().items()) == 300
+        db.close()
+
+def test_ingest_stream_resume():
+    tmp = tempfile.mkdtemp()
+    np.random.seed(11)
+    data = (np.random.randn(1000, 24) * 5.0).astype(np.float32)
+    npy_path = os.path.join(tmp, "vectors.npy")
+    np.save(npy_path, data)
+
+    # Interrupt a generator-fed run after its third chunk; only committed rows count
+    def interrupted(chunks):
+        for i, chunk in enumerate(chunks):
+            if i == 3:
+                raise KeyboardInterrupt
+            yield chunk
+
+    db = LeechDB(os.path.join(tmp, "stream.db"))
+    chunks = LeechDB._array_chunks(data, None, 0, 100)
+    try:
+        db.ingest_stream(interrupted(chunks), chunk_size=100, commit_every=200, name="gen")
+    except KeyboardInterrupt:
+        pass
+    # The uncommitted third chunk was rolled back
+    assert db._get_meta("ingest_progress:gen") == "200" and not db._dirty_keys
+    assert db.bucket_stats()["postings"] == 200 and not db.conn.in_transaction
+    resumed = db.ingest_stream(LeechDB._array_chunks(data, None, 0, 100), name="gen")
+    print(f"Generator source resumed after row 200, ingested {resumed} more rows")
+    assert resumed == 800 and db.bucket_stats()["postings"] == 1000
+
+    # A .npy path runs through the job manifest; fail the third chunk's quantization
+    db2 = LeechDB(os.path.join(tmp, "npy.db"))
+    quantify = db2.leech.quantify_batch
+    calls = []
+    def failing_quantify(*args, **kwargs):
+        calls.append(1)
+        if len(calls) == 3:
+            raise KeyboardInterrupt
+        return quantify(*args, **kwargs)
+    db2.leech.quantify_batch = failing_quantify
+    try:
+        db2.ingest_stream(npy_path, labels="item_", chunk_size=128)
+    except KeyboardInterrupt:
+        pass
+    db2.leech.quantify_batch = quantify
+    status = db2.job_status("vectors.npy")
+    print(f".npy source interrupted: {status}")
+    assert status["committed_rows"] == 256 and db2.bucket_stats()["postings"] == 256
+    assert db2._get_meta(f"ingest_progress:{os.path.abspath(npy_path)}") is None
+
+    # Resuming continues with the pending chunks; a further call is a no-op
+    assert db2.ingest_stream(npy_path, labels="item_") == 744
+    assert db2.ingest_stream(npy_path, labels="item_") == 0
+    assert db2.job_status("vectors.npy")["status"] == "done"
+    assert db2.query_exact_batch(data[::97]) == [[f"item_{i}"] for i in range(0, 1000, 97)]
+    try:
+        db2.ingest_stream(npy_path, labels=lambda start, stop: [])
+        raise AssertionError("A label callable was accepted for a .npy path")
+    except ValueError:
+        pass
+    db.close()
+    db2.close()
+
+def test_resumable_job():
+    tmp = tempfile.mkdtemp()
+    np.random.seed(14)
+    data = (np.random.randn(500, 24) * 5.0).astype(np.float32)
+    npy_path = os.path.join(tmp, "job.npy")
+    np.save(npy_path, data)
+
+    db = LeechDB(os.path.join(tmp, "job.db"))
+    job = db.create_job(npy_path, chunk_size=100, label_prefix="row_")
+    assert db.create_job(npy_path, chunk_size=100, label_prefix="row_") == job
+
+    # Simulate a crash after two committed chunks, with the third chunk written twice
+    vectors, prefix = db.job_source(job)
+    for chunk_index, start, stop in db.pending_chunks(job)[:2]:
+        db.commit_job_chunk(job, chunk_index, start, db.leech.quantify_batch(vectors[start:stop]), label_prefix=prefix)
+    db.commit_job_chunk(job, 1, 100, db.leech.quantify_batch(vectors[100:200]), label_prefix=prefix)
+    status = db.job_status(job)
+    print(f"Job after crash: {status}")
+    assert (status["committed_chunks"], status["committed_rows"], status["status"]) == (2, 200, "running")
+
+    assert db.resume(job) == 3
+    assert db.resume(job) == 0
+    status = db.job_status(job)
+    assert status["status"] == "done" and status["committed_rows"] == 500
+    assert db.bucket_stats()["postings"] == 500
+    assert db.query_exact(data[321]) == ["row_321"]
+    db.close()
+
+if __name__ == "__main__":
+    test_postings_storage()
+    test_label_validation()
+    test_decoder_recorded()
+    test_migrate_json_to_postings()
+    test_index_batch_precomputed()
+    test_query_neighborhood()
+    test_batch_queries()
+    test_concurrent_readers()
+    test_reader_pool_is_bounded()
+    test_pooled_reader_sees_new_commits()
+    test_residual_reranking()
+    test_result_cache_invalidation()
+    test_cache_skips_results_read_before_a_commit()
+    test_bucket_stats()
+    test_ingest_stream_resume()
+    test_resumable_job()
@@ -0,0 +1,109 @@
+import numpy as np
+from core.lattices import LeechLattice
+from core import tables
+
+def _brute_force_topk_dists(x, decoder, k):
+    """
+    k smallest squared distances from x over every coset, moving any subset of
+    each coset's 6 cheapest coordinates to their second-nearest rounding.
+    """
+    C2 = tables.golay_c2().astype(np.float64)
+    masks = np.arange(64)
+    bits = (masks[:, None] >> np.arange(6)) & 1
+    found = []
+    for h in ([0] if decoder == "coset" else [0, 1]):
+        T = (x - h - C2) / 4.0
+        R = np.rint(T)
+        E = T - R
+        delta = np.sort(16.0 * (1.0 - 2.0 * np.abs(E)), axis=1)[:, :6]
+        d = 16.0 * np.sum(E * E, axis=1)[:, None] + delta @ bits.T
+        if decoder != "coset":
+            wrong = (R.sum(axis=1).astype(np.int64) - h) & 1
+            d = d[(wrong[:, None] ^ (bits.sum(axis=1) & 1)[None, :]) == 0]
+        found.append(d.ravel())
+    return np.sort(np.concatenate(found))[:k]
+
+def test_golay_decoder_matches_exhaustive():
+    fast = LeechLattice(decoder="golay")
+    reference = LeechLattice(decoder="exhaustive")
+
+    np.random.seed(7)
+    for scale in [0.5, 3.0, 25.0]:
+        X = np.random.randn(200, 24) * scale
+        q_fast = fast.quantify_batch(X)
+        q_ref = reference.quantify_batch(X)
+        print(f"Scale {scale}: identical to exhaustive = {np.array_equal(q_fast, q_ref)}")
+        assert np.array_equal(q_fast, q_ref)
+
+def test_golay_decoder_covers_odd_half():
+    leech = LeechLattice(decoder="golay")
+    # (-3, 1^23) is a minimal vector from the odd half of the lattice
+    v = np.ones(24)
+    v[0] = -3
+    q = leech.quantify(v + np.random.uniform(-0.3, 0.3, 24))
+    print(f"Odd point recovered: {q[:4]}...")
+    assert np.array_equal(q, v)
+
+def test_golay_decoder_single_matches_batch():
+    leech = LeechLattice(decoder="golay")
+    np.random.seed(3)
+    X = np.random.randn(20, 24) * 4.0
+    singles = np.array([leech.quantify(x) for x in X])
+    assert np.array_equal(singles, leech.quantify_batch(X))
+
+def test_quantify_topk():
+    np.random.seed(11)
+    X = np.random.randn(50, 24) * 3.0
+    for decoder in ["coset", "golay"]:
+        leech = LeechLattice(decoder=decoder)
+        points, dists = leech.quantify_topk(X, 5)
+        print(f"{decoder}: top-5 shapes {points.shape}, {dists.shape}")
+        assert points.shape == (50, 5, 24) and dists.shape == (50, 5)
+        assert np.array_equal(points[:, 0], leech.quantify_batch(X))
+        assert np.all(np.diff(dists, axis=1) >= 0)
+        assert np.allclose(np.sum((X[:, None, :] - points) ** 2, axis=2), dists, atol=1e-3)
+        assert np.array_equal(leech.quantify_batch(points.reshape(-1, 24)), points.reshape(-1, 24))
+
+        for x, d in zip(X[:10], dists[:10]):
+            assert np.allclose(d, _brute_force_topk_dists(x, decoder, 5), atol=1e-3)
+
+    golay_points, golay_dists = LeechLattice(decoder="golay").quantify_topk(X, 5)
+    ref_points, ref_dists = LeechLattice(decoder="exhaustive").quantify_topk(X, 5)
+    assert np.array_equal(golay_points, ref_points)
+    assert np.allclose(golay_dists, ref_dists)
+
+def test_quantify_batch_streaming():
+    np.random.seed(5)
+    X = np.random.randn(700, 24) * 3.0
+    for decoder in ["coset", "golay"]:
+        leech = LeechLattice(decoder=decoder)
+        expected = leech.quantify_batch(X)
+
+        # Small budget forces many chunks through reused scratch buffers
+        budget = 4 * leech._BYTES_PER_ROW[decoder]
+        out = np.zeros((700, 24), dtype=np.float32)
+        result = leech.quantify_batch(X, out=out, max_memory_bytes=budget)
+        assert result is out and np.array_equal(out, expected)
+
+        chunks = (X[i:i + 250] for i in range(0, 700, 250))
+        streamed = list(leech.quantify_stream(chunks, max_memory_bytes=budget))
+        print(f"{decoder}: {len(streamed)} streamed chunks")
+        assert [len(c) for c in streamed] == [250, 250, 200]
+        assert np.array_equal(np.vstack(streamed), expected)
+
+def test_quantify_batch_threads():
+    np.random.seed(9)
+    X = np.random.randn(501, 24) * 3.0
+    for decoder in ["coset", "golay"]:
+        leech = LeechLattice(decoder=decoder)
+        threaded = leech.quantify_batch(X, n_threads=4)
+        print(f"{decoder}: threaded result identical = {np.array_equal(threaded, leech.quantify_batch(X))}")
+        assert np.array_equal(threaded, leech.quantify_batch(X))
+
+if __name__ == "__main__":
+    test_golay_decoder_matches_exhaustive()
+    test_golay_decoder_covers_odd_half()
+    test_golay_decoder_single_matches_batch()
+    test_quantify_topk()
+    test_quantify_batch_streaming()
+    test_quantify_batch_threads()
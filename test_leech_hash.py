@@ -0,0 +1,107 @@
+import os
+import tempfile
+import numpy as np
+from core import codec
+from leech_hash import LeechHash, MultiLeechHash
+
+def _brute_neighborhood(lh, vector):
+    central = lh.leech.quantify(vector)
+    keys = list(lh.table.keys())
+    dists_sq = np.sum((codec.unpack_keys(keys).astype(int) - central) ** 2, axis=1)
+    return sorted(label for i in np.where((dists_sq == 0) | (dists_sq == 32))[0] for label in lh.table[keys[i]])
+
+def test_index_many_and_neighborhood():
+    np.random.seed(16)
+    data = np.random.randn(3000, 24) * 5.0
+    labels = [f"item_{i}" for i in range(3000)]
+
+    lh = LeechHash()
+    lh.index_many(labels[:2000], data[:2000])
+    for label, vec in zip(labels[2000:2010], data[2000:2010]):
+        lh.index(label, vec)
+    lh.index_many(labels[2010:], data[2010:])
+
+    single = LeechHash()
+    for label, vec in zip(labels[:300], data[:300]):
+        single.index(label, vec)
+    first = set(labels[:300])
+    assert all(single.table[k] == [l for l in lh.table[k] if l in first] for k in single.table)
+
+    # The occupied-point array tracks the table and grew geometrically
+    assert len(lh.occupied_points) == len(lh.table)
+    assert set(codec.pack_keys(lh.occupied_points)) == set(lh.table)
+    assert len(lh._points) >= len(lh.table) and len(lh._points) & (len(lh._points) - 1) == 0
+
+    # Plant a neighbor next to item_0's bucket
+    central = lh.leech.quantify(data[0])
+    lh.index_many(["planted"], (central + lh.leech.get_neighbor_offsets()[42]).reshape(1, -1))
+
+    probing = LeechHash()
+    probing.index_many(labels, data)
+    probing._SCAN_MAX_POINTS = 0  # Force the fingerprint probe path
+    for q in data[:5]:
+        assert sorted(lh.lookup_neighborhood(q)) == _brute_neighborhood(lh, q)
+        assert sorted(probing.lookup_neighborhood(q)) == _brute_neighborhood(probing, q)
+    result = lh.lookup_neighborhood(data[0])
+    print(f"Neighborhood of item_0 in {len(lh.table)} buckets: {result}")
+    assert "planted" in result and "item_0" in result
+
+def test_multi_table_recall():
+    np.random.seed(17)
+    data = np.random.randn(1000, 24) * 4.0
+    labels = [f"item_{i}" for i in range(1000)]
+    queries = data[:100] + np.random.randn(100, 24) * 0.3
+
+    recalls = {}
+    for num_tables in (1, 8):
+        mlh = MultiLeechHash(num_tables=num_tables, scale=0.5, seed=3)
+        mlh.index_many(labels, data)
+        results, sizes = mlh.lookup_batch(queries, return_sizes=True)
+        recalls[num_tables] = np.mean([f"item_{i}" in r for i, r in enumerate(results)])
+        assert sizes.shape == (100, num_tables + 1)
+        assert np.array_equal(sizes[:, -1], [len(r) for r in results])
+        print(f"L={num_tables}: recall {recalls[num_tables]:.2f}, mean candidates {sizes[:, -1].mean():.1f}")
+    assert recalls[8] > recalls[1]
+
+    # An indexed vector collides with itself in every table
+    assert "item_5" in mlh.lookup(data[5])
+
+def test_save_load():
+    np.random.seed(18)
+    centers = np.random.randn(40, 24) * 5.0
+    data = centers[np.arange(800) % 40] + np.random.randn(800, 24) * 0.3
+    lh = LeechHash()
+    lh.index_many([f"item_{i}" for i in range(800)], data)
+    path = os.path.join(tempfile.mkdtemp(), "hash.snapshot")
+    lh.save(path)
+    print(f"Saved {len(lh.table)} buckets in {os.path.getsize(path)} bytes")
+
+    mapped = LeechHash.load(path)
+    rebuilt = LeechHash.load(path, mmap=False)
+    assert rebuilt.table == lh.table
+    for q in data[:20:4]:
+        assert sorted(mapped.lookup(q)) == sorted(lh.lookup(q))
+        assert sorted(mapped.lookup_multiprobe(q)) == sorted(lh.lookup_multiprobe(q))
+        assert sorted(mapped.lookup_neighborhood(q)) == sorted(lh.lookup_neighborhood(q))
+        assert sorted(rebuilt.lookup_neighborhood(q)) == sorted(lh.lookup_neighborhood(q))
+
+    try:
+        mapped.index("new", data[0])
+        assert False, "Expected the mmap-loaded table to be read-only"
+    except ValueError:
+        pass
+    rebuilt.index("new", data[0])
+    assert "new" in rebuilt.lookup(data[0])
+
+    # The decoder travels with the saved table
+    golay = LeechHash(decoder="golay")
+    golay.index_many([f"item_{i}" for i in range(100)], data[:100])
+    golay.save(path)
+    loaded = LeechHash.load(path)
+    assert loaded.leech.decoder == "golay"
+    assert loaded.lookup(data[7]) == golay.lookup(data[7])
+
+if __name__ == "__main__":
+    test_index_many_and_neighborhood()
+    test_multi_table_recall()
+    test_save_load()
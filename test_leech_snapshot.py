@@ -0,0 +1,39 @@
+import os
+import tempfile
+import numpy as np
+from leech_db import LeechDB
+from leech_snapshot import LeechSnapshot, export_snapshot
+
+def test_snapshot_matches_db():
+    tmp = tempfile.mkdtemp()
+    np.random.seed(8)
+    centers = np.random.randn(50, 24) * 5.0
+    data = centers[np.arange(500) % 50] + np.random.randn(500, 24) * 0.5
+    labels = [f"item_{i}" for i in range(500)]
+
+    for storage in LeechDB.STORAGE_FORMATS:
+        db = LeechDB(os.path.join(tmp, f"{storage}.db"), storage=storage)
+        db.index_batch(labels, data)
+        path = os.path.join(tmp, f"{storage}.snapshot")
+        export_snapshot(db, path)
+
+        snapshot = LeechSnapshot(path)
+        print(f"{storage}: snapshot with {len(snapshot)} buckets, {os.path.getsize(path)} bytes")
+        queries = np.vstack((data[:40], np.random.randn(5, 24) * 5.0))
+        assert [sorted(r) for r in snapshot.query_exact_batch(queries)] == \
+               [sorted(r) for r in db.query_exact_batch(queries)]
+        assert sorted(snapshot.query_multiprobe(data[3])) == sorted(db.query_multiprobe(data[3]))
+        for q in data[:5]:
+            assert sorted(snapshot.query_neighborhood(q)) == sorted(db.query_neighborhood(q))
+        db.close()
+
+def test_empty_snapshot():
+    path = os.path.join(tempfile.mkdtemp(), "empty.snapshot")
+    db = LeechDB(":memory:")
+    snapshot = export_snapshot(db, path)
+    assert len(snapshot) == 0 and snapshot.query_exact(np.zeros(24)) == []
+    db.close()
+
+if __name__ == "__main__":
+    test_snapshot_matches_db()
+    test_empty_snapshot()
@@ -1,5 +1,5 @@
 import numpy as np
-from core.lattices import E8Lattice
+from core.lattices import E8Lattice, LeechLattice
 
 def test_e8_roots():
     e8 = E8Lattice()
@@ -15,5 +15,23 @@ def test_e8_roots():
             
     print("SUCCESS: All roots have correct norm squared (2.0)")
 
+def test_leech_minimal_vectors():
+    leech = LeechLattice()
+    min_vecs = leech._enumerate_minimal_vectors()
+    print(f"Number of Leech minimal vectors: {len(min_vecs)} ({min_vecs.dtype}, {min_vecs.nbytes} bytes)")
+    assert min_vecs.shape == (196560, 24) and min_vecs.dtype == np.int8
+
+    norms = np.sum(min_vecs.astype(int)**2, axis=1)
+    assert np.all(norms == 32)
+    assert len(np.unique(min_vecs, axis=0)) == 196560
+
+    # One representative per +-v pair: together with the negations it covers everything
+    half = leech.get_minimal_vectors(one_per_pair=True)
+    assert len(half) == 98280
+    both = np.unique(np.vstack((half, -half)), axis=0)
+    assert np.array_equal(both, np.unique(min_vecs, axis=0))
+    print("SUCCESS: All minimal vectors have norm squared 32 and form +-v pairs")
+
 if __name__ == "__main__":
     test_e8_roots()
+    test_leech_minimal_vectors()
@@ -0,0 +1,119 @@
+import os
+import tempfile
+import time
+import numpy as np
+import leech_db
+from leech_db import LeechDB
+from parallel_indexer import ParallelLeechIndexer
+
+def test_pipelined_indexing():
+    np.random.seed(12)
+    data = (np.random.randn(1200, 24) * 5.0).astype(np.float32)
+    labels = [f"item_{i}" for i in range(1200)]
+    tmp = tempfile.mkdtemp()
+
+    for backend in ParallelLeechIndexer.BACKENDS:
+        path = os.path.join(tmp, f"{backend}.db")
+        indexer = ParallelLeechIndexer(path, num_workers=2, backend=backend)
+        report = indexer.index_pipelined(labels, data, chunk_size=250, queue_size=2, commit_every=500)
+        assert report["chunks"] == 5 and report["vectors"] == 1200
+
+        db = LeechDB(path)
+        assert db.bucket_stats()["postings"] == 1200
+        assert db.query_exact_batch(data[::111]) == [[f"item_{i}"] for i in range(0, 1200, 111)]
+        db.close()
+
+def test_pipelined_writer_failure_stops_quantization():
+    np.random.seed(16)
+    data = (np.random.randn(4000, 24) * 5.0).astype(np.float32)
+    # The first chunk has an invalid label, so the writer fails right away
+    labels = [None] + [f"item_{i}" for i in range(1, 4000)]
+    tmp = tempfile.mkdtemp()
+
+    calls = []
+    class CountingLattice(leech_db.LeechLattice):
+        def quantify_batch(self, *args, **kwargs):
+            calls.append(1)
+            return super().quantify_batch(*args, **kwargs)
+
+    # The threads backend quantizes with the LeechDB's own lattice
+    original = leech_db.LeechLattice
+    leech_db.LeechLattice = CountingLattice
+    try:
+        for backend in ParallelLeechIndexer.BACKENDS:
+            calls.clear()
+            path = os.path.join(tmp, f"{backend}.db")
+            indexer = ParallelLeechIndexer(path, num_workers=2, backend=backend)
+            t0 = time.perf_counter()
+            try:
+                indexer.index_pipelined(labels, data, chunk_size=50, queue_size=2)
+                raise AssertionError("Writer error was not raised")
+            except ValueError as e:
+                elapsed = time.perf_counter() - t0
+                print(f"{backend}: writer failed with '{e}' after {elapsed:.2f}s, "
+                      f"{len(calls)} in-process quantize calls")
+            if backend == "threads":
+                # Quantization stopped long before the 80 chunks
+                assert len(calls) < 20
+            # Nothing the failed run wrote was committed, whatever the backend
+            db = LeechDB(path)
+            assert db.bucket_stats()["postings"] == 0 and db.query_exact(data[1]) == []
+            db.close()
+    finally:
+        leech_db.LeechLattice = original
+
+def test_indexer_decoder():
+    np.random.seed(20)
+    data = (np.random.randn(600, 24) * 5.0).astype(np.float32)
+    labels = [f"item_{i}" for i in range(600)]
+    tmp = tempfile.mkdtemp()
+    for backend in ("processes", "shared_memory"):
+        path = os.path.join(tmp, f"golay_{backend}.db")
+        ParallelLeechIndexer(path, num_workers=2, backend=backend, decoder="golay").index_pipelined(
+            labels, data, chunk_size=200)
+        db = LeechDB(path)
+        assert db.leech.decoder == "golay"
+        assert db.query_exact_batch(data[::61]) == [[f"item_{i}"] for i in range(0, 600, 61)]
+        db.close()
+
+def test_shared_memory_backend():
+    np.random.seed(13)
+    data = (np.random.randn(900, 24) * 5.0).astype(np.float32)
+    labels = [f"item_{i}" for i in range(900)]
+    path = os.path.join(tempfile.mkdtemp(), "shm.db")
+
+    indexer = ParallelLeechIndexer(path, num_workers=2, backend="shared_memory")
+    indexer.index_large_dataset(labels, data)
+    db = LeechDB(path)
+    print(f"Shared-memory backend stats: {db.bucket_stats()}")
+    assert db.bucket_stats()["postings"] == 900
+    assert db.query_exact_batch(data[::89]) == [[f"item_{i}"] for i in range(0, 900, 89)]
+    db.close()
+
+def test_parallel_job_resume():
+    tmp = tempfile.mkdtemp()
+    np.random.seed(15)
+    data = (np.random.randn(600, 24) * 5.0).astype(np.float32)
+    npy_path = os.path.join(tmp, "job.npy")
+    np.save(npy_path, data)
+    path = os.path.join(tmp, "job.db")
+
+    db = LeechDB(path)
+    job = db.create_job(npy_path, chunk_size=150)
+    vectors, _ = db.job_source(job)
+    db.commit_job_chunk(job, 0, 0, db.leech.quantify_batch(vectors[:150]))
+    db.close()
+
+    status = ParallelLeechIndexer(path, num_workers=2).resume(job)
+    assert status["status"] == "done" and status["committed_rows"] == 600
+    db = LeechDB(path)
+    assert db.bucket_stats()["postings"] == 600
+    assert db.query_exact(data[599]) == ["599"]
+    db.close()
+
+if __name__ == "__main__":
+    test_pipelined_indexing()
+    test_pipelined_writer_failure_stops_quantization()
+    test_indexer_decoder()
+    test_shared_memory_backend()
+    test_parallel_job_resume()
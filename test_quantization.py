@@ -22,5 +22,21 @@ def test_e8_quantization():
     q3 = e8.quantify(v3)
     print(f"Input: {v3}, Quantified: {q3}, Match: {np.allclose(v3, q3)}")
 
+def test_e8_quantization_batch():
+    e8 = E8Lattice()
+    np.random.seed(42)
+    X = np.random.randn(1000, 8) * 2
+
+    batch = e8.quantify_batch(X)
+    scalar = np.array([e8.quantify(x) for x in X])
+    print(f"Batch matches scalar decoder: {np.array_equal(batch, scalar)}")
+    assert np.array_equal(batch, scalar)
+
+    # Preallocated output buffer
+    out = np.empty_like(X)
+    result = e8.quantify_batch(X, out=out)
+    assert result is out and np.array_equal(out, scalar)
+
 if __name__ == "__main__":
     test_e8_quantization()
+    test_e8_quantization_batch()
@@ -0,0 +1,54 @@
+import os
+import tempfile
+import numpy as np
+from leech_db import LeechDB
+from sharded_leech_db import ShardedLeechDB
+
+def test_sharded_matches_single_db():
+    tmp = tempfile.mkdtemp()
+    np.random.seed(6)
+    data = np.random.randn(600, 24) * 5.0
+    labels = [f"item_{i}" for i in range(600)]
+
+    single = LeechDB(os.path.join(tmp, "single.db"))
+    single.index_batch(labels, data)
+    sharded = ShardedLeechDB(os.path.join(tmp, "sharded.db"), num_shards=3)
+    sharded.index_parallel(labels[:300], data[:300], num_workers=2)
+    sharded.index_batch(labels[300:], data[300:])
+
+    sizes = [s.conn.execute("SELECT COUNT(*) FROM postings").fetchone()[0] for s in sharded.shards]
+    print(f"Shard sizes: {sizes}")
+    assert sum(sizes) == 600 and min(sizes) > 0
+
+    queries = np.vstack((data[::7], np.random.randn(10, 24) * 5.0))
+    assert sharded.query_exact_batch(queries) == single.query_exact_batch(queries)
+    assert sharded.query_exact(data[1]) == ["item_1"]
+    assert sharded.query_multiprobe(data[2], probes=4) == single.query_multiprobe(data[2], probes=4)
+    for q in data[:5]:
+        assert sorted(sharded.query_neighborhood(q)) == sorted(single.query_neighborhood(q))
+    sharded.close()
+    single.close()
+
+    # Reopening with a different shard count is refused
+    try:
+        ShardedLeechDB(os.path.join(tmp, "sharded.db"), num_shards=2)
+        assert False, "Expected a shard count mismatch"
+    except ValueError as e:
+        print(f"Reopen with wrong shard count: {e}")
+
+def test_power_of_two_shards_all_used():
+    tmp = tempfile.mkdtemp()
+    np.random.seed(17)
+    data = np.random.randn(500, 24) * 5.0
+    for num_shards in (2, 4, 8):
+        sharded = ShardedLeechDB(os.path.join(tmp, f"pow2_{num_shards}.db"), num_shards=num_shards)
+        sharded.index_batch([f"item_{i}" for i in range(500)], data)
+        sizes = [s.conn.execute("SELECT COUNT(*) FROM postings").fetchone()[0] for s in sharded.shards]
+        print(f"{num_shards} shards: {sizes}")
+        assert sum(sizes) == 500 and min(sizes) > 0
+        assert sharded.query_exact(data[3]) == ["item_3"]
+        sharded.close()
+
+if __name__ == "__main__":
+    test_sharded_matches_single_db()
+    test_power_of_two_shards_all_used()
@@ -0,0 +1,33 @@
+import os
+import tempfile
+import numpy as np
+from core import tables
+from core.lattices import E8Lattice, GolayCode
+
+def test_tables_cached_on_disk():
+    previous_dir = tables._cache_dir
+    tables.set_cache_dir(tempfile.mkdtemp())
+    try:
+        codewords = tables.golay_codewords()
+        print(f"Codewords: {codewords.shape}, cached at {tables.cache_path('golay_codewords')}")
+        assert codewords.shape == (4096, 24)
+        assert os.path.exists(tables.cache_path("golay_codewords"))
+        assert np.array_equal(codewords, GolayCode()._enumerate_codewords())
+        assert np.array_equal(tables.golay_c2(), 2 * codewords)
+
+        # Same table object within a process, memory-mapped reload after a reset
+        assert tables.golay_codewords() is codewords
+        tables.clear()
+        reloaded = tables.golay_codewords()
+        assert isinstance(reloaded, np.memmap)
+        assert np.array_equal(reloaded, codewords)
+
+        roots = E8Lattice().get_shortest_vectors()
+        assert roots.shape == (240, 8)
+        assert np.array_equal(roots, E8Lattice()._enumerate_roots())
+    finally:
+        tables.clear(disk=True)
+        tables.set_cache_dir(previous_dir)
+
+if __name__ == "__main__":
+    test_tables_cached_on_disk()
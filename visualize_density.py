@@ -1,28 +1,25 @@
-import sqlite3
 import numpy as np
 import matplotlib.pyplot as plt
 from sklearn.manifold import TSNE
+from leech_db import LeechDB
 
 def visualize_lattice_density(db_path="leech_empire_100k.db"):
     print("--- Generating Leech Lattice Semantic Heatmap ---")
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
+    db = LeechDB(db_path)
     
-    # 1. Fetch occupied centroids and their populations
-    cursor.execute("SELECT centroid_id, length(labels) - length(replace(labels, ',', '')) + 1 FROM buckets")
-    rows = cursor.fetchall()
+    # 1. Fetch occupied centroids and their populations from the maintained bucket stats
+    key_arrays, counts = db.bucket_counts()
     
-    if not rows:
+    if not len(counts):
         print("No data found in DB.")
+        db.close()
         return
 
-    keys = [row[0] for row in rows]
-    counts = [row[1] for row in rows]
+    stats = db.bucket_stats()
+    print(f"{stats['buckets']} buckets, {stats['postings']} postings, "
+          f"mean size {stats['mean_bucket_size']:.2f}, max size {stats['max_bucket_size']}")
     
-    # 2. Convert keys to 24D arrays
-    key_arrays = np.array([[int(x) for x in k.split(",")] for k in keys])
-    
-    # 3. Dimensionality Reduction (TSNE) for 24D -> 2D visualization
+    # 2. Dimensionality Reduction (TSNE) for 24D -> 2D visualization
     print(f"Reducing {len(key_arrays)} high-dimensional centroids to 2D...")
     # Use a subset if too large for TSNE
     sample_size = min(2000, len(key_arrays))
@@ -31,7 +28,7 @@ def visualize_lattice_density(db_path="leech_empire_100k.db"):
     tsne = TSNE(n_components=2, perplexity=30, random_state=42)
     vis_data = tsne.fit_transform(key_arrays[indices])
     
-    # 4. Plot
+    # 3. Plot
     plt.figure(figsize=(12, 8))
     scatter = plt.scatter(vis_data[:, 0], vis_data[:, 1], 
                          c=np.array(counts)[indices], 
@@ -48,7 +45,7 @@ def visualize_lattice_density(db_path="leech_empire_100k.db"):
     output_path = "leech_heatmap.png"
     plt.savefig(output_path)
     print(f"Heatmap saved to {output_path}")
-    conn.close()
+    db.close()
 
 if __name__ == "__main__":
     visualize_lattice_density()